@@ -1,10 +1,14 @@
 # !/usr/bin/env python3
-import time, sys, argparse
+import time, sys, argparse, asyncio
 from types import SimpleNamespace
 from rich.console import Console
 from .logger import log
+from .cowin_session import CoWinSession
 from .booking_client import BookingClient
+from .async_booking_client import AsyncBookingClient
+from .orchestrator import BookingOrchestrator
 from .utils import pause
+from .dashboard import get_dashboard, set_headless
 
 # from utils import (generate_token_OTP, generate_token_OTP_manual, check_and_book, beep, BENEFICIARIES_URL, WARNING_BEEP_DURATION,
 #     display_info_dict, save_user_info, collect_user_details, get_saved_user_info, confirm_and_proceed)
@@ -12,13 +16,45 @@ from .utils import pause
 console = Console()
 
 parser = argparse.ArgumentParser()
+parser.add_argument('--mobile', nargs='+', type=int, default=[9657830140], help='registered mobile number(s) to book for')
+parser.add_argument('--asyncio', action='store_true', help='poll the calendar on an asyncio event loop')
+parser.add_argument('--headless', action='store_true', help='do not draw the live dashboard')
+parser.add_argument('--capture', metavar='FILE', help='record redacted api traffic to a .jsonl.gz capture')
+parser.add_argument('--replay', metavar='FILE', help='serve api traffic from a capture instead of the network')
+parser.add_argument('--replay-speed', type=float, default=None, help='replay at recorded response times (1.0), or faster')
+parser.add_argument('--race', type=int, default=None, metavar='N', help='race bookings for the best N sessions (automated captcha solving only)')
+parser.add_argument('--http2', action='store_true', help='multiplex api requests over one HTTP/2 connection (needs httpx[http2])')
+parser.add_argument('--no-token-cache', action='store_true', help='do not reuse or save access tokens across restarts')
+args = parser.parse_args()
+if args.asyncio and (args.replay or args.http2):
+    # the event loop talks to the api through aiohttp, neither the replay nor the HTTP/2 adapter applies
+    parser.error("--replay and --http2 are not supported with --asyncio")
+set_headless(args.headless)
+if args.http2:
+    CoWinSession.http2 = True
+if args.no_token_cache:
+    CoWinSession.token_cache_file = None
+if args.race:
+    BookingClient.race_size = args.race
+if args.capture:
+    CoWinSession.capture_file = args.capture
+if args.replay:
+    CoWinSession.replay_file = args.replay
+    CoWinSession.replay_speed = args.replay_speed
 
 try:
     # mobile = input("Enter the registered mobile number: ")
     # filename = 'vaccine-booking-details-' + mobile + ".json"
     # otp_pref = input("\nDo you want to enter OTP manually, instead of auto-read? \nRemember selecting n would require some setup described in README (y/n Default n): ")
     # otp_pref = otp_pref if otp_pref else "n"
-    mobile = 9657830140
+    if len(args.mobile) > 1:
+        BookingOrchestrator(args.mobile).run()
+        exit(0)
+
+    mobile = args.mobile[0]
+    if args.asyncio:
+        asyncio.run(AsyncBookingClient(mobile).run())
+
     bc = BookingClient(mobile)
 
     while True:
@@ -33,6 +69,7 @@ try:
 
 
 except KeyboardInterrupt as exc:
+    get_dashboard().stop()
     print('', end="\r", flush=True)
     sys.stdout.flush()
     console.print("User Interrupted", style="bold red", justify="left")
@@ -0,0 +1,174 @@
+"""
+Module defines non blocking alert dispatcher with pluggable sinks.
+
+Alerts are queued by the polling/booking code and delivered by background threads,
+one per sink, so a slow beep or webhook never delays polling or booking.
+"""
+import sys
+import time
+import json
+import queue
+import threading
+import subprocess
+from typing import NamedTuple, Tuple
+from datetime import datetime
+
+import requests
+
+from .logger import log
+from .utils import beep, WARNING_BEEP_DURATION
+from .config import (
+    ALERT_SINKS,
+    ALERT_WEBHOOK_URL,
+    ALERT_FILE,
+    ALERT_DEDUPE_TTL,
+    ALERT_QUEUE_SIZE,
+)
+
+
+class Alert(NamedTuple):
+    message: str
+    kind: str = 'slot'          # 'slot', 'warning' or 'booked'
+    freq: int = WARNING_BEEP_DURATION[0]
+    duration: int = WARNING_BEEP_DURATION[1]
+    repeat: int = 1
+    keys: Tuple[str, ...] = ()  # session ids, used for dedupe
+    created: float = 0
+
+
+class AudioSink(object):
+    name = 'audio'
+
+    def __call__(self, alert):
+        for _ in range(alert.repeat):
+            beep(alert.freq, alert.duration)
+
+
+class DesktopSink(object):
+    name = 'desktop'
+
+    def __call__(self, alert):
+        title = f"CoWIN {alert.kind}"
+        if sys.platform == "darwin":
+            script = f'display notification {json.dumps(alert.message)} with title {json.dumps(title)}'
+            cmd = ['osascript', '-e', script]
+        elif sys.platform.startswith('win32'):
+            cmd = ['msg', '*', f"{title}: {alert.message}"]
+        else:
+            cmd = ['notify-send', title, alert.message]
+        try:
+            subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            log.debug(f"Desktop notification unavailable: {e}")
+
+
+class WebhookSink(object):
+    name = 'webhook'
+
+    def __init__(self, url):
+        self.url = url
+        self.session = requests.Session()
+
+    def __call__(self, alert):
+        self.session.post(self.url, json=alert._asdict(), timeout=2)
+
+
+class FileSink(object):
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, alert):
+        with open(self.path, 'a') as f:
+            f.write(f"{datetime.fromtimestamp(alert.created).isoformat()} [{alert.kind}] {alert.message}\n")
+
+
+class AlertDispatcher(object):
+    """
+    Queues alerts and fans them out to sinks, each drained by its own daemon thread.
+
+    Slot alerts carrying session ids are dropped when all of those sessions already
+    alerted within `dedupe_ttl` seconds, so the same slot does not re-alert every cycle.
+    """
+
+    def __init__(self, sinks, dedupe_ttl=ALERT_DEDUPE_TTL, queue_size=ALERT_QUEUE_SIZE):
+        self.sinks = list(sinks)
+        self.dedupe_ttl = dedupe_ttl
+        self._seen = {}     # session id -> last alerted
+        self._lock = threading.Lock()
+        self._queues = []
+        for sink in self.sinks:
+            sink_queue = queue.Queue(maxsize=queue_size)
+            threading.Thread(
+                target=self._drain, args=(sink, sink_queue),
+                name=f'AlertThread-{sink.name}', daemon=True,
+            ).start()
+            self._queues.append(sink_queue)
+
+    def _is_duplicate(self, keys, now):
+        if not keys:
+            return False
+        with self._lock:
+            if len(self._seen) > 10000:
+                self._seen = {k: t for k, t in self._seen.items() if now - t < self.dedupe_ttl}
+            fresh = [k for k in keys if now - self._seen.get(k, float('-inf')) >= self.dedupe_ttl]
+            for k in fresh:
+                self._seen[k] = now
+            return not fresh
+
+    def alert(self, message, kind='slot', freq=WARNING_BEEP_DURATION[0], duration=WARNING_BEEP_DURATION[1], repeat=1, keys=()):
+        """
+        This function queues an alert for every sink and returns immediately,
+        alerts are dropped (never blocking the caller) when a sink falls behind
+        """
+        now = time.time()
+        if self._is_duplicate(tuple(keys), now):
+            return False
+        alert = Alert(message, kind, freq, duration, repeat, tuple(keys), now)
+        for sink_queue in self._queues:
+            try:
+                sink_queue.put_nowait(alert)
+            except queue.Full:
+                pass
+        return True
+
+    def warning(self, message):
+        return self.alert(message, kind='warning')
+
+    def _drain(self, sink, sink_queue):
+        while True:
+            alert = sink_queue.get()
+            try:
+                sink(alert)
+            except Exception as e:
+                log.debug(f"Alert sink {sink.name} failed: {e}")
+
+
+def build_sinks(names=ALERT_SINKS, webhook_url=ALERT_WEBHOOK_URL, path=ALERT_FILE):
+    sinks = []
+    for name in names:
+        if name == 'audio':
+            sinks.append(AudioSink())
+        elif name == 'desktop':
+            sinks.append(DesktopSink())
+        elif name == 'webhook' and webhook_url:
+            sinks.append(WebhookSink(webhook_url))
+        elif name == 'file' and path:
+            sinks.append(FileSink(path))
+    return sinks
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """
+    This function returns the process wide dispatcher, built from config on first use
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher(build_sinks())
+        return _dispatcher
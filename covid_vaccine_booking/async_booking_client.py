@@ -0,0 +1,121 @@
+import asyncio
+
+from .logger import log
+from .booking_client import BookingClient
+from .async_cowin_client import AsyncCoWinClient
+from .scheduler import BudgetExhausted
+from .captcha import get_captcha_window
+from .metrics import metrics
+from .config import (
+    CALENDAR_CYCLE_DEADLINE,
+)
+
+
+class AsyncBookingClient(BookingClient):
+    """
+    Booking client polling the calendar on an asyncio event loop.
+
+    Calendar requests for all locations share one connection pool and are awaited together,
+    booking (captcha prompt included) runs in the default executor so it never blocks the loop,
+    which meanwhile drives the captcha window.
+    """
+
+    def __init__(self, mobile) -> None:
+        super().__init__(mobile)
+        self.aclient = AsyncCoWinClient(mobile=mobile, auth_session=self.client.session)
+        self._loop = None
+
+    async def fetch_calendars(self, fetch, params_ls):
+        """
+        This function
+            1. Schedules one calendar request per location on the event loop,
+            2. Waits at most CALENDAR_CYCLE_DEADLINE seconds for the whole cycle, and
+            3. Returns list of (location, params, response) in location order for the requests that finished in time
+        """
+        tasks = [
+            (location, params, asyncio.ensure_future(
+                fetch(params=params, headers=self.conditional_headers(params)),
+            ))
+            for location, params in params_ls
+        ]
+        done, pending = await asyncio.wait([t for _, _, t in tasks], timeout=CALENDAR_CYCLE_DEADLINE)
+        for task in pending:
+            task.cancel()
+        if pending:
+            log.warning(f"{len(pending)} calendar request(s) missed the {CALENDAR_CYCLE_DEADLINE}s cycle deadline")
+
+        results, skipped = [], 0
+        for location, params, task in tasks:
+            if task not in done:
+                continue
+            if isinstance(task.exception(), BudgetExhausted):
+                skipped += 1
+                continue
+            if task.exception():
+                log.error(f"Calendar request failed for {location}: {task.exception()}")
+                continue
+            results.append((location, params, task.result()))
+        if skipped:
+            log.warning(f"Rate limit budget exhausted, skipped {skipped} location(s) this cycle")
+        return results
+
+    async def check_calendar(self):
+        try:
+            self.dashboard.start()
+            self.captcha_pool
+            api, params_ls = self.calendar_query()
+            fetch = getattr(self.aclient, f'get_{api}')
+            options = self.process_calendars(await self.fetch_calendars(fetch, params_ls))
+            metrics.maybe_export()
+            return options
+
+        except Exception as e:
+            print(str(e))
+            self.alerts.warning(str(e))
+
+    def refresh_calendar(self):
+        # called from the booking thread while a captcha is typed, the loop itself is free
+        asyncio.run_coroutine_threadsafe(self.check_calendar(), self._loop).result()
+
+    async def check_and_book(self, **kwargs):
+        """
+        This function
+            1. Checks the vaccination calendar for available slots,
+            2. Picks a viable option, if any,
+            3. Books it without blocking the event loop, and
+            4. Returns True or False depending on Token Validity
+        """
+        options = await self.check_calendar()
+
+        if isinstance(options, bool):
+            return False
+
+        options = self.rank_options(options or [])
+        new_req = self.build_booking_request(options)
+
+        if new_req is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.wait_for_next_cycle)
+            return True
+
+        print(f"Booking with info: {new_req}")
+        loop = self._loop = asyncio.get_running_loop()
+        booking = loop.run_in_executor(None, self.attempt_booking, options, new_req)
+        if self.info.captcha_automation:
+            return await booking
+        # the captcha window has to be driven from the main thread, the one running this loop
+        window = get_captcha_window()
+        while not booking.done():
+            window.pump()
+            await asyncio.wait([booking], timeout=0.05)
+        return booking.result()
+
+    async def run(self):
+        async with self.aclient:
+            while True:
+                try:
+                    await self.check_and_book()
+
+                except Exception as e:
+                    print(str(e))
+                    print('Retryin in 5 seconds')
+                    await asyncio.sleep(5)
@@ -0,0 +1,60 @@
+from functools import partial
+
+from .cowin_client import CoWinClient
+from .async_cowin_session import AsyncCoWinSession
+
+
+class AsyncCoWinClient(object):
+    """
+    Async CoWin Client, same api methods as CoWinClient returning coroutines.
+    """
+    mobile = None
+
+    base_url = CoWinClient.base_url
+    api = CoWinClient.api
+    api_methods = CoWinClient.api_methods
+
+    def __init__(self, mobile, auth_session=None, *args, **kwargs):
+        """
+        constructor.
+        """
+        super().__init__(*args, **kwargs)
+        self.mobile = mobile
+        self.session = AsyncCoWinSession(mobile=mobile, auth_session=auth_session)
+
+        for api, url in self.api.items():
+            for method in self.api_methods:
+                if not hasattr(self, f'{method}_{api}'):
+                    if method == 'get' and api in CoWinClient.cached_apis:
+                        setattr(self, f'{method}_{api}', self._get_budgeted_api_method(url=url))
+                    else:
+                        setattr(self, f'{method}_{api}', self._get_partial_api_method(method, url=url))
+
+    def _get_partial_api_method(self, method, url, **kwargs):
+
+        method = getattr(self.session, method)
+        if method:
+            return partial(method, url=url, **kwargs)
+
+    def _get_budgeted_api_method(self, url, **kwargs):
+        """
+        This function charges every GET of the polled apis to the rate limit budget before it is sent,
+        there is no response cache in front of the async session
+        """
+        fetch = self._get_partial_api_method('get', url=url, **kwargs)
+
+        async def budgeted_fetch(params=None, **request_kwargs):
+            self.session.auth_session.scheduler.charge(url)
+            return await fetch(params=params, **request_kwargs)
+        return budgeted_fetch
+
+    async def get_districts(self, state_id):
+        url = self.api['districts']
+        return await self.session.get(url=url.format(state_id=state_id))
+
+    async def __aenter__(self):
+        await self.session.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
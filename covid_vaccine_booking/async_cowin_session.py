@@ -0,0 +1,192 @@
+"""
+Module defines asyncio counterpart of CoWinSession.
+"""
+import json
+import time
+import asyncio
+import aiohttp
+from functools import partial
+import requests
+from datetime import timedelta
+
+from .logger import log
+from .cowin_session import CoWinSession
+from .scheduler import endpoint_key
+from .metrics import observe
+from .config import (
+    ASYNC_MAX_CONNECTIONS,
+)
+
+
+class AsyncRequest(object):
+    """
+    The sent request, exposing the subset of requests.PreparedRequest used by the capture.
+    """
+
+    def __init__(self, method, url, headers, body):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.body = body
+
+
+class AsyncResponse(object):
+    """
+    Fully read response, exposing the subset of requests.Response used by the booking code.
+    """
+
+    def __init__(self, status_code, content, headers, url, elapsed, request=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.url = url
+        self.elapsed = elapsed
+        self.request = request
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self, **kwargs):
+        return json.loads(self.content, **kwargs)
+
+    def raise_for_status(self):
+        # same exception as requests.Response, callers handle both clients alike
+        if 400 <= self.status_code:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class AsyncCoWinSession(object):
+    """
+    Async CoWin session.
+
+    Access tokens are owned by a regular CoWinSession (and its AuthThread), so the OTP flow
+    is shared with the blocking client; only the api traffic runs on the event loop.
+    """
+
+    base_url = CoWinSession.base_url
+    api = CoWinSession.api
+    timeout = CoWinSession.timeout
+    retry_obj = CoWinSession.retry_obj
+    max_connections = ASYNC_MAX_CONNECTIONS
+
+    mobile = None
+
+    def __init__(self, mobile, auth_session=None):
+        self.mobile = mobile
+        self.auth_session = auth_session or CoWinSession(mobile=mobile)
+        self.headers = dict(self.auth_session.headers)
+        self._session = None
+
+    async def open(self):
+        if self._session is None or self._session.closed:
+            connect, read = self.timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+                headers=self.headers,
+            )
+        return self
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get_access_token(self):
+        if not self.auth_session.is_access_token_valid:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.auth_session.get_access_token)
+        return self.auth_session._access_token_info['token']
+
+    def _is_auth_exempt(self, url):
+        return url.startswith((self.auth_session.storage_url, *self.api.values()))
+
+    @staticmethod
+    def to_requests_error(exc, url):
+        if isinstance(exc, asyncio.TimeoutError):
+            return requests.Timeout(f"{exc!r} for url: {url}")
+        return requests.ConnectionError(f"{exc!r} for url: {url}")
+
+    async def _request_once(self, method, url, headers, **kwargs):
+        started = time.perf_counter()
+        async with self._session.request(method, url, headers=headers, **kwargs) as resp:
+            content = await resp.read()
+            body = json.dumps(kwargs['json']) if kwargs.get('json') is not None else kwargs.get('data')
+            return AsyncResponse(
+                status_code=resp.status,
+                content=content,
+                headers=resp.headers,
+                url=str(resp.url),
+                elapsed=timedelta(seconds=time.perf_counter() - started),
+                request=AsyncRequest(method, str(resp.url), headers, body),
+            )
+
+    def response_hook(self, response):
+        # what CoWinSession.response_hook does for every response, but the 401 handling (see request)
+        self.auth_session.scheduler.record(response.url, response.status_code, response.elapsed.total_seconds())
+        observe('request', response.elapsed.total_seconds(), endpoint=endpoint_key(response.url))
+        if self.auth_session.capture:
+            self.auth_session.capture.record(response)
+
+    async def _send(self, method, url, headers, **kwargs):
+        """
+        This function sends the request, retrying like CoWinSession's Custom_Retry: on its status codes,
+        on connection errors, and on timeouts of idempotent requests (a POST may have reached the server).
+        Errors not retried are raised as requests.ConnectionError / Timeout
+        """
+        await self.open()
+        retries = self.retry_obj.total
+        for attempt in range(retries + 1):
+            try:
+                response = await self._request_once(method, url, headers, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                sent = not isinstance(exc, aiohttp.ClientConnectorError)
+                if attempt == retries or (sent and not self.retry_obj._is_method_retryable(method)):
+                    raise self.to_requests_error(exc, url) from exc
+                reason = exc
+            else:
+                self.response_hook(response)
+                if not self.retry_obj.is_retry(method, response.status_code) or attempt == retries:
+                    return response
+                reason = response.status_code
+            backoff = min(self.retry_obj.backoff_factor * (2 ** attempt), self.retry_obj.BACKOFF_MAX)
+            log.debug(f"Retrying {method} {url} after {reason!r} in {backoff}s")
+            await asyncio.sleep(backoff)
+
+    async def request(self, method, url, auth=True, **kwargs):
+        """
+        This function
+            1. Sends the request with bearer token (unless auth is False),
+            2. Retries on the same status codes as CoWinSession, and
+            3. On 401, drops the rejected token, waits for a fresh one and re-sends once, like CoWinSession.response_hook
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        token = None
+        if auth:
+            token = await self.get_access_token()
+            headers['Authorization'] = f"Bearer { token }"
+
+        response = await self._send(method, url, headers, **kwargs)
+        if auth and response.status_code == 401 and not self._is_auth_exempt(url):
+            await asyncio.get_running_loop().run_in_executor(
+                None, partial(self.auth_session.refresh_access_token, rejected=token),
+            )
+            headers['Authorization'] = f"Bearer { self.auth_session._access_token_info['token'] }"
+            headers['REATTEMPT'] = '1'
+            response = await self._send(method, url, headers, **kwargs)
+            if response.status_code == 401:
+                response.raise_for_status()
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
@@ -0,0 +1,132 @@
+"""
+Module drives BookingClient against the local stand-in server and reports the time from
+slot publication to successful booking.
+
+    python -m covid_vaccine_booking.benchmark --releases 20 --latency 50 --error 429=0.02
+"""
+import time
+import json
+import argparse
+import statistics
+
+from .standin_server import StandInState, serve, parse_error_rates
+
+BENCHMARK_MOBILE = 9999999999
+BENCHMARK_DISTRICT = 1
+BENCHMARK_DATA = {
+    'beneficiary_ls': [{
+        'bref_id': '12345678901234',
+        'name': 'Stand-in Beneficiary',
+        'vaccine': '',
+        'age': 31,
+        'status': 'Not Vaccinated',
+    }],
+    'location_ls': [{'district_id': BENCHMARK_DISTRICT, 'district_name': 'Stand-in', 'alert_freq': 440}],
+    'location_blocks': [],
+    'search_option': 2,
+    'minimum_slots': 1,
+    'refresh_freq': 1,
+    'auto_book': 'yes-please',
+    'start_date': 1,
+    'vaccine_type': '',
+    'fee_type': ['Free', 'Paid'],
+    'captcha_automation': False,
+    'captcha_automation_api_key': None,
+}
+
+
+def use_base_urls(base_url, storage_url_base):
+    """
+    This function points the api urls at the stand-in; config is already imported with the package,
+    so COWIN_BASE_URL / COWIN_STORAGE_URL_BASE only apply to a separately started process
+    """
+    from . import cowin_session
+    from .cowin_client import CoWinClient
+
+    for cls in (cowin_session.CoWinSession, CoWinClient):
+        cls.api = {api: url.replace(cls.base_url, base_url, 1) for api, url in cls.api.items()}
+        cls.base_url = base_url
+    cowin_session.STORAGE_URL_BASE = storage_url_base
+
+
+def build_client(refresh_freq, rate_limit):
+    from .dashboard import set_headless
+    from .scheduler import AdaptiveScheduler
+    from .cowin_session import CoWinSession
+    from .booking_client import BookingClient
+    from .cowin_client import CoWinClient
+
+    set_headless(True)
+    # every cycle has to see the slot release, not a calendar fetched before it
+    CoWinClient.response_cache.ttl = 0
+    if rate_limit:
+        CoWinSession.scheduler = AdaptiveScheduler(calls=rate_limit, period=1, burst=rate_limit)
+
+    client = BookingClient(BENCHMARK_MOBILE, data=dict(BENCHMARK_DATA, refresh_freq=refresh_freq))
+    client.exit_on_booking = False
+    # the stand-in accepts any captcha, solving it is benchmarked separately
+    client.generate_captcha = lambda: 'STAND'
+    return client
+
+
+def run(releases=10, latency=0.0, jitter=0.0, error_rates=None, refresh_freq=1, rate_limit=50, timeout=60):
+    """
+    This function
+        1. Starts the stand-in and points the client at it,
+        2. Publishes one slot at a time and runs check_and_book until it is booked, and
+        3. Returns the per release detect-to-book latencies in seconds
+    """
+    state = StandInState(latency=latency, jitter=jitter, error_rates=error_rates)
+    server, base_url, storage_url = serve(state)
+    use_base_urls(base_url, storage_url)
+
+    client = build_client(refresh_freq, rate_limit)
+    print("Waiting for the stand-in access token..")
+    client.client.session.get_access_token()
+
+    try:
+        for release in range(releases):
+            booked = len(state.bookings)
+            state.release(district_id=BENCHMARK_DISTRICT, capacity=1)
+            deadline = time.time() + timeout
+            client.booked = False
+            while len(state.bookings) == booked and time.time() < deadline:
+                client.check_and_book()
+            if len(state.bookings) == booked:
+                print(f"Release {release + 1}: not booked within {timeout} seconds")
+    finally:
+        server.shutdown()
+
+    return [booking['latency'] for booking in state.bookings]
+
+
+def report(latencies):
+    if not latencies:
+        return {'count': 0}
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        'max': ordered[-1],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect-to-book benchmark against the local CoWIN stand-in")
+    parser.add_argument('--releases', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0, help='added server latency per request, ms')
+    parser.add_argument('--jitter', type=float, default=0, help='server latency jitter, ms')
+    parser.add_argument('--error', action='append', default=[], metavar='STATUS=RATE', help='e.g. --error 429=0.05')
+    parser.add_argument('--refresh-freq', type=float, default=1, help='client refresh frequency, seconds')
+    parser.add_argument('--rate-limit', type=int, default=50, help='client calls/second budget, 0 keeps the production budget')
+    parser.add_argument('--timeout', type=float, default=60, help='give up on a release after this many seconds')
+    args = parser.parse_args()
+
+    latencies = run(
+        releases=args.releases, latency=args.latency / 1000, jitter=args.jitter / 1000,
+        error_rates=parse_error_rates(args.error), refresh_freq=args.refresh_freq,
+        rate_limit=args.rate_limit, timeout=args.timeout,
+    )
+    print(json.dumps(report(latencies), indent=2))
@@ -1,28 +1,78 @@
 import uuid
+import math
+import hashlib
+import threading
 import tabulate, copy, time, datetime, requests, sys, os, random
 from collections import Counter
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
 from functools import cached_property, partial
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, NamedTuple
 from inputimeout import inputimeout, TimeoutOccurred
 
 from .logger import log
-from .captcha import captcha_builder, captcha_builder_auto
+from .captcha import CaptchaWindow, get_captcha_window
+from .captcha_pool import CaptchaPool
+from .captcha_solvers import CaptchaSolvers, GlyphSolver, AntiCaptchaSolver, ManualSolver
+from .booking_errors import (
+    classify_booking_response,
+    BOOKED,
+    TOKEN_EXPIRED,
+    RATE_LIMITED,
+    CAPTCHA_WRONG,
+    UNKNOWN,
+    UNAVAILABLE,
+)
 from .cowin_client import CoWinClient
+from .scheduler import BudgetExhausted
 from .booking_data import BookingData
+from .decoders import filter_calendar
+from .eligibility import compile_criteria
+from .options import SlotOption
+from .ranking import OptionRanker
+from .alerts import get_dispatcher
+from .dashboard import get_dashboard
+from .metrics import metrics, span
+from .config import (
+    CALENDAR_MAX_WORKERS,
+    CALENDAR_CYCLE_DEADLINE,
+    BOOKING_RACE_SIZE,
+    BOOKING_RACE_STAGGER,
+    BOOKING_MAX_RETRIES,
+    BOOKING_UNAVAILABLE_TTL,
+    CAPTCHA_LOCAL_SOLVER,
+)
 from .utils import *
 
 
+class CalendarFingerprint(NamedTuple):
+    digest: bytes
+    etag: str
+    last_modified: str
+    center_count: int
+    options: list
+
+
 class BookingClient(object):
     """
     CoWin Client.
     """
 
-    def __init__(self, mobile) -> None:
+    exit_on_booking = True
+    race_size = BOOKING_RACE_SIZE
+
+    def __init__(self, mobile, client=None, data=None) -> None:
 
         self.mobile = mobile
-        self.client = CoWinClient(mobile=mobile)
-        self.info = BookingData(mobile=mobile, cowin_client=self.client)
+        self.client = client or CoWinClient(mobile=mobile)
+        self.info = BookingData(mobile=mobile, cowin_client=self.client, data=data)
+        self.booked = False
+        self._calendar_fingerprints = {}
+        self._unavailable_sessions = {}     # session id -> when a booking found it full or closed
+        self._listed_sessions = {}          # location -> session ids viable in its latest calendar
+        self._vanished_sessions = set()     # session ids a newer calendar no longer lists
+        self._last_calendar_check = 0
 
     def get_start_date(self):
         sd = self.info.start_date
@@ -44,88 +94,330 @@ class BookingClient(object):
         min_age = min(age_list)
         return min_age
 
-    def filter_centers_by_age(self, resp):
-        center_age_filter = 45 if self.min_age_booking >= 45 else 18
-        if "centers" in resp:
-            for center in list(resp["centers"]): 
-                if center["sessions"][0]['min_age_limit'] != center_age_filter:
-                    resp["centers"].remove(center)
+    @cached_property
+    def max_age_booking(self):
+        return max(item["age"] for item in self.info.beneficiary_ls)
 
-        return resp
+    @cached_property
+    def dose(self):
+        return 2 if self.info.beneficiary_ls[0]["status"] == "Partially Vaccinated" else 1
+
+    @cached_property
+    def session_filter(self):
+        """
+        This function compiles fee type, age bracket, vaccine, minimum slots and dose capacity
+        into one predicate(center, session)
+        """
+        return compile_criteria(
+            min_age=self.min_age_booking,
+            max_age=self.max_age_booking,
+            fee_types=self.info.fee_type,
+            vaccine=self.info.vaccine_type,
+            minimum_slots=self.info.minimum_slots,
+            dose=self.dose,
+        )
 
     def viable_options(self, resp,):
-        options = []
-        if len(resp["centers"]) >= 0:
-            for center in resp["centers"]:
-                for session in center["sessions"]:
-                    if (
-                        (session["available_capacity"] >= self.info.minimum_slots)
-                        and (session["min_age_limit"] <= self.min_age_booking)
-                        and (center["fee_type"] in self.info.fee_type)
-                    ):
-                        out = {
-                            "name": center["name"],
-                            "district": center["district_name"],
-                            "pincode": center["pincode"],
-                            "center_id": center["center_id"],
-                            "available": session["available_capacity"],
-                            "date": session["date"],
-                            "slots": session["slots"],
-                            "session_id": session["session_id"],
-                        }
-                        options.append(out)
-
-                    else:
-                        pass
+        is_viable = self.session_filter
+        return [
+            SlotOption.from_session(center, session)
+            for center in resp["centers"]
+            for session in center["sessions"]
+            if is_viable(center, session)
+        ]
+
+
+    @cached_property
+    def booking_payload(self):
+        """
+        This function builds the option independent part of the booking request once
+        """
+        return {
+            "beneficiaries": [
+                beneficiary["bref_id"] for beneficiary in self.info.beneficiary_ls
+            ],
+            "dose": self.dose,
+        }
+
+    @property
+    def captcha_solved_automatically(self):
+        """
+        This function tells whether some solver answers captchas without the user
+        """
+        return CAPTCHA_LOCAL_SOLVER or bool(self.info.captcha_automation)
+
+    @cached_property
+    def captcha_solvers(self):
+        solvers = []
+        if CAPTCHA_LOCAL_SOLVER:
+            solvers.append(GlyphSolver())
+        if self.info.captcha_automation:
+            solvers.append(AntiCaptchaSolver(self.info.captcha_automation_api_key))
         else:
-            pass
+            solvers.append(ManualSolver(while_waiting=self.poll_while_waiting))
+        return CaptchaSolvers(solvers)
 
-        return options
+    def solve_captcha(self, captcha):
+        return self.captcha_solvers.solve(captcha)
+
+    @cached_property
+    def captcha_pool(self):
+        """
+        This function starts the background captcha pool; captchas are pre-solved when solving
+        is automated or the local solver knows them, a manual solve still happens at booking time
+        but skips the captcha request. The pool only fills while viable options are listed.
+        """
+        return CaptchaPool(
+            fetch=self.client.post_captcha,
+            # without automated solvers the pool only pre-fetches, the manual solver is built at booking time
+            solve=self.captcha_solvers.solve_automated if self.captcha_solved_automatically else None,
+            require_answer=self.info.captcha_automation,
+        ).start()
+
+    @property
+    def alerts(self):
+        return get_dispatcher()
+
+    @property
+    def dashboard(self):
+        return get_dashboard()
+
+    @cached_property
+    def ranker(self):
+        return OptionRanker(
+            ranking=self.info.ranking,
+            preferred_pincodes=self.info.preferred_pincodes,
+            preferred_centers=self.info.preferred_centers,
+            home_pincode=self.info.home_pincode,
+        )
+
+    @staticmethod
+    def calendar_key(params):
+        return tuple(sorted(params.items()))
+
+    def conditional_headers(self, params):
+        """
+        This function returns If-None-Match/If-Modified-Since headers from the previous response for these params
+        """
+        fingerprint = self._calendar_fingerprints.get(self.calendar_key(params))
+        headers = {}
+        if fingerprint:
+            if fingerprint.etag:
+                headers['If-None-Match'] = fingerprint.etag
+            if fingerprint.last_modified:
+                headers['If-Modified-Since'] = fingerprint.last_modified
+        return headers
+
+    def next_cycle_delay(self):
+        """
+        This function returns seconds to wait before the next calendar check: the user's refresh frequency,
+        or longer when the rate limit budget needs time to refill for all locations
+        """
+        api, params_ls = self.calendar_query()
+        budget_delay = self.client.session.scheduler.delay(self.client.api[api], len(params_ls))
+        return max(self.info.refresh_freq, budget_delay)
+
+    def wait_for_next_cycle(self, delay=None):
+        delay = self.next_cycle_delay() if delay is None else delay
+        budget = self.client.session.scheduler.summary()
+        remaining = delay
+        while remaining > 0:
+            self.dashboard.set_status(
+                f"No viable options. Next update in {math.ceil(remaining)} seconds..\nRate limit budget: {budget}"
+            )
+            step = min(1, remaining)
+            if self.info.captcha_automation or not CaptchaWindow.on_gui_thread():
+                time.sleep(step)
+            else:
+                get_captcha_window().pump(step)     # keeps the captcha window responsive
+            remaining -= step
 
+    @staticmethod
+    def timed_fetch(fetch, params, **kwargs):
+        with span('calendar_request', location=params.get('district_id', params.get('pincode'))):
+            return fetch(params=params, **kwargs)
 
-    def check_calendar_by_district(self):
+    def fetch_calendars(self, fetch, params_ls, conditional_headers=None):
         """
         This function
-            1. Takes details required to check vaccination calendar
+            1. Sends one calendar request per location, all at the same time (at most CALENDAR_MAX_WORKERS in flight),
+               with `conditional_headers(params)` (default: from this client's own previous responses),
+            2. Waits at most CALENDAR_CYCLE_DEADLINE seconds for the whole cycle, and
+            3. Returns list of (location, params, response) in location order for the requests that finished in time
+        Every cycle gets its own workers: a request still retrying after the deadline cannot be
+        cancelled, it finishes on its own without taking a worker from the next cycles.
+        """
+        conditional_headers = conditional_headers or self.conditional_headers
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(CALENDAR_MAX_WORKERS, len(params_ls))),
+            thread_name_prefix='CalendarThread',
+        )
+        futures = [
+            (location, params, executor.submit(
+                self.timed_fetch, fetch, params=params, headers=conditional_headers(params),
+            ))
+            for location, params in params_ls
+        ]
+        done, not_done = wait([f for _, _, f in futures], timeout=CALENDAR_CYCLE_DEADLINE)
+        for future in not_done:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if not_done:
+            log.warning(f"{len(not_done)} calendar request(s) missed the {CALENDAR_CYCLE_DEADLINE}s cycle deadline")
+
+        results, skipped = [], 0
+        for location, params, future in futures:
+            if future not in done:
+                continue
+            try:
+                results.append((location, params, future.result()))
+            except BudgetExhausted:
+                skipped += 1
+            except Exception as e:
+                log.error(f"Calendar request failed for {location}: {e}")
+        if skipped:
+            log.warning(f"Rate limit budget exhausted, skipped {skipped} location(s) this cycle")
+        return results
+
+    def calendar_query(self):
+        """
+        This function
+            1. Picks the calendar api based on search option (district or pincode), and
+            2. Returns the api name along with list of (location, params) to query
+        """
+        vaccine_type_param = {'vaccine': self.info.vaccine_type} if self.info.vaccine_type else {}
+        start_date = self.get_start_date()
+        if self.info.search_option == 2:
+            api, key = 'calendar_by_district', 'district_id'
+        else:
+            api, key = 'calendar_by_pincode', 'pincode'
+        params_ls = [
+            (location, {key: location[key], 'date': start_date, **vaccine_type_param})
+            for location in self.info.location_ls
+        ]
+        return api, params_ls
+
+    def options_from_calendar(self, data):
+        """
+        This function returns (number of centers, list of viable options) from a decoded calendar response,
+        None if the response has no centers
+        """
+        if "centers" not in data:
+            return None
+        return len(data["centers"]), self.viable_options(data)
+
+    def calendar_options(self, params, resp):
+        """
+        This function
+            1. Fingerprints the calendar response body (or takes a 304 as unchanged),
+            2. Reuses the options computed last time when the fingerprint did not change, else
+            3. Decodes and filters the response, and
+            4. Returns (number of centers, list of viable options), None if the response is unusable
+        """
+        key = self.calendar_key(params)
+        previous = self._calendar_fingerprints.get(key)
+        if resp.status_code == 304 and previous:
+            return previous.center_count, previous.options
+        if resp.status_code != 200:
+            return None
+
+        digest = hashlib.blake2b(resp.content, digest_size=16).digest()
+        if previous and previous.digest == digest:
+            return previous.center_count, previous.options
+
+        location = params.get('district_id', params.get('pincode'))
+        center_count, sessions = filter_calendar(resp.content, self.session_filter, location=location)
+        options = [SlotOption.from_session(center, session) for center, session in sessions]
+        self._calendar_fingerprints[key] = CalendarFingerprint(
+            digest=digest,
+            etag=resp.headers.get('ETag'),
+            last_modified=resp.headers.get('Last-Modified'),
+            center_count=center_count,
+            options=options,
+        )
+        return center_count, options
+
+    def process_calendars(self, results):
+        """
+        This function
+            1. Takes list of (location, params, response) from calendar requests
             2. Filters result by minimum number of slots available
-            3. Returns False if token is invalid
+            3. Alerts for locations having viable options, and
             4. Returns list of vaccination centers & slots if available
         """
-        try:
-            print(
-                "==================================================================================="
-            )
-            today = datetime.datetime.today()
-            vaccine_type_param = {'vaccine': self.info.vaccine_type} if self.info.vaccine_type else {}
-            start_date = self.get_start_date()
-            options = []
-            for location in self.info.location_ls:
-                params = {'district_id': location["district_id"], 'date':start_date}
-                params.update(vaccine_type_param)
-                resp = self.client.get_calendar_by_district(params=params)
-                if resp.status_code == 200:
-                    resp = resp.json()
-                    resp = self.filter_centers_by_age(resp)
-                    if "centers" in resp:
-                        print(
-                            f"Centers available in {location['district_name']} from {start_date} as of {today.strftime('%Y-%m-%d %H:%M:%S')}: {len(resp['centers'])}"
-                        )
-                        options += self.viable_options(resp)
-                else:
-                    pass
+        calendars = [
+            (location, self.calendar_options(params, resp))
+            for location, params, resp in results
+        ]
 
-            for location in self.info.location_ls:
-                if location["district_name"] in [option["district"] for option in options]:
-                    for _ in range(2):
-                        beep(location["alert_freq"], 150)
-            return options
+        # forget fingerprints of dates/locations no longer queried
+        keys = {self.calendar_key(params) for _, params, _ in results}
+        self._calendar_fingerprints = {k: v for k, v in self._calendar_fingerprints.items() if k in keys}
 
-        except Exception as e:
-            print(str(e))
-            beep(WARNING_BEEP_DURATION[0], WARNING_BEEP_DURATION[1])
+        return self.report_options(calendars)
 
+    def report_options(self, calendars):
+        """
+        This function
+            1. Takes list of (location, (number of centers, options)) with None for unusable responses,
+            2. Prints center counts and alerts for locations having viable options, and
+            3. Returns list of vaccination centers & slots if available
+        """
+        today = datetime.datetime.today()
+        start_date = self.get_start_date()
+        options = []
+        for location, calendar in calendars:
+            if calendar:
+                center_count, location_options = calendar
+                label = location.get('district_name', location.get('pincode'))
+                self.dashboard.update_location(
+                    label,
+                    f"Centers available in {label} from {start_date} as of {today.strftime('%Y-%m-%d %H:%M:%S')}: {center_count}",
+                    group=self.mobile,
+                )
+                options += location_options
+                self.track_listed(label, location_options)
+        self._last_calendar_check = time.time()
+        if options:
+            self.captcha_pool.want()
+
+        for location in self.info.location_ls:
+            if "district_name" in location:
+                found = [option for option in options if option.district == location["district_name"]]
+            else:
+                found = [option for option in options if option.pincode == int(location["pincode"])]
+            if found:
+                self.alerts.alert(
+                    f"{len(found)} viable session(s) in {location.get('district_name', location.get('pincode'))}",
+                    freq=location["alert_freq"], duration=150, repeat=2,
+                    keys=[option.session_id for option in found],
+                )
+        return options
+
+    def track_listed(self, location, options):
+        """
+        This function records the sessions a fresh calendar of `location` lists; those listed
+        before but not anymore have vanished (booked out, or below the minimum slots)
+        """
+        listed = {option.session_id for option in options}
+        self._vanished_sessions -= listed
+        self._vanished_sessions |= self._listed_sessions.get(location, set()) - listed
+        self._listed_sessions[location] = listed
+
+    def still_listed(self, details):
+        return details['session_id'] not in self._vanished_sessions
+
+    def refresh_calendar(self):
+        self.check_calendar()
+
+    def poll_while_waiting(self):
+        """
+        This function keeps checking the calendar, at the usual cycle rate, while the user types a captcha
+        """
+        if time.time() - self._last_calendar_check >= self.next_cycle_delay():
+            self.refresh_calendar()
 
-    def check_calendar_by_pincode(self):
+    def check_calendar(self):
         """
         This function
             1. Takes details required to check vaccination calendar
@@ -134,98 +426,297 @@ class BookingClient(object):
             4. Returns list of vaccination centers & slots if available
         """
         try:
-            print("===================================================================================")
-            today = datetime.datetime.today()
-            vaccine_type_param = {'vaccine': self.info.vaccine_type} if self.info.vaccine_type else {}
-            start_date = self.get_start_date()
-            options = []
-            for location in self.info.location_ls:
-                params = {'pincode': location["pincode"], 'date':start_date}
-                params.update(vaccine_type_param)
-                resp = self.client.get_calendar_by_pincode(params=params)
-
-                if resp.status_code == 200:
-                    resp = resp.json()
-                    resp = self.filter_centers_by_age(resp)
-                    if "centers" in resp:
-                        print(
-                            f"Centers available in {location['pincode']} from {start_date} as of {today.strftime('%Y-%m-%d %H:%M:%S')}: {len(resp['centers'])}"
-                        )
-                        options += self.viable_options(resp)
-                else:
-                    pass
-
-            for location in self.info.location_ls:
-                if int(location["pincode"]) in [option["pincode"] for option in options]:
-                    for _ in range(2):
-                        beep(location["alert_freq"], 150)
-
+            self.dashboard.start()
+            self.captcha_pool
+            api, params_ls = self.calendar_query()
+            fetch = getattr(self.client, f'get_{api}')
+            options = self.process_calendars(self.fetch_calendars(fetch, params_ls))
+            log.debug(f"Calendar cache: {self.client.response_cache.stats()}")
+            if 'captcha_solvers' in self.__dict__:
+                log.debug(f"Captcha solvers: {self.captcha_solvers.summary()}")
+            metrics.maybe_export()
             return options
 
         except Exception as e:
             print(str(e))
-            beep(WARNING_BEEP_DURATION[0], WARNING_BEEP_DURATION[1])
+            self.alerts.warning(str(e))
 
 
     def generate_captcha(self):
         print(
             "================================= GETTING CAPTCHA =================================================="
         )
-        resp = self.client.post_captcha()
+        pooled = self.captcha_pool.take()
+        if pooled is not None:
+            log.info(f'Using pooled captcha, {time.time() - pooled.fetched_at:.1f} seconds old')
+            return pooled.answer if pooled.answer is not None else self.solve_captcha(pooled.captcha)
+
+        with span('captcha_fetch'):
+            resp = self.client.post_captcha()
         log.info(f'Captcha Response Code: {resp.status_code}')
         if resp.status_code == 200:
-            if self.info.captcha_automation:
-                return captcha_builder_auto(resp.json(), self.info.captcha_automation_api_key)
-            else:
-                return captcha_builder(resp.json())
+            return self.solve_captcha(resp.json())
 
 
-    def book_appointment(self, details):
+    def on_booked(self, details):
+        self.booked = True
+        self.alerts.alert(f"Booked session {details['session_id']}", kind='booked')
+        print(
+            "##############    BOOKED!  ############################    BOOKED!  ##############"
+        )
+        print(
+            "                        Hey, Hey, Hey! It's your lucky day!                       "
+        )
+        # requests.put("https://kvdb.io/thofdz57BqhTCaiBphDCp/" + str(uuid.uuid4()), data={})
+        if not self.exit_on_booking:
+            return True
+        pause("\nPress any key thrice to exit program.", 3)
+        sys.exit()
+
+    def mark_unavailable(self, session_id):
+        self._unavailable_sessions[session_id] = time.time()
+
+    def bookable(self, options):
+        """
+        This function drops options whose session recently failed as full or closed
+        """
+        now = time.time()
+        unavailable = {
+            session_id for session_id, marked in self._unavailable_sessions.items()
+            if now - marked < BOOKING_UNAVAILABLE_TTL
+        }
+        self._unavailable_sessions = {session_id: self._unavailable_sessions[session_id] for session_id in unavailable}
+        return [option for option in options if option.session_id not in unavailable]
+
+    def booking_requests(self, options):
+        """
+        This function lazily yields booking requests for ranked options, a random slot each,
+        skipping sessions found full or closed in the meantime
+        """
+        for option in options:
+            if option.session_id in self._unavailable_sessions or option.session_id in self._vanished_sessions:
+                continue
+            yield dict(
+                self.booking_payload,
+                center_id=option.center_id,
+                session_id=option.session_id,
+                slot=random.choice(option.slots),
+            )
+
+    def recover(self, outcome, details):
+        """
+        This function applies the recovery for a failed booking outcome and returns
+        'retry' (same slot), 'next' (next ranked option) or 'stop' (back to polling)
+        """
+        if outcome in UNAVAILABLE:
+            self.mark_unavailable(details['session_id'])
+            return 'next'
+        if outcome == TOKEN_EXPIRED:
+            self.client.session.refresh_access_token()
+            return 'retry'
+        if outcome == RATE_LIMITED:
+            self.wait_for_next_cycle()
+            return 'stop'
+        if outcome == CAPTCHA_WRONG:
+            return 'retry'
+        return 'stop'
+
+    def book_appointment(self, details, fallbacks=()):
         """
         This function
-            1. Takes details in json format
-            2. Attempts to book an appointment using the details
-            3. Returns True or False depending on Token Validity
+            1. Takes details in json format, and booking requests for the next ranked options
+            2. Attempts to book an appointment using the details, unless the session vanished from
+               the calendar (still polled in the background) while the captcha was being solved
+            3. On failure retries with a new captcha or token, moves on to the next option when the
+               session is gone, or backs off, depending on the class of error
+            4. Returns True or False depending on Token Validity
         """
         try:
-            valid_captcha = True
-            while valid_captcha:
+            fallbacks = iter(fallbacks)
+            retries = 0
+            while details is not None:
                 captcha = self.generate_captcha()
             # os.system('say "Slot Spotted."')
+                if not self.still_listed(details):
+                    # gone from the calendar while the captcha was typed, the booking would fail
+                    print(f"Session {details['session_id']} is no longer listed, moving on")
+                    self.captcha_pool.resume()
+                    details, retries = next(fallbacks, None), 0
+                    continue
                 details["captcha"] = captcha
 
                 print(
                     "================================= ATTEMPTING BOOKING =================================================="
                 )
 
-                resp = self.client.post_booking(json=details)
+                with span('booking'):
+                    resp = self.client.post_booking(json=details)
+                self.captcha_pool.resume()
                 log.info(f"Booking Response Code: {resp.status_code}")
                 log.info(f"Booking Response : {resp.text}")
 
-                if resp.status_code == 200:
-                    beep(WARNING_BEEP_DURATION[0], WARNING_BEEP_DURATION[1])
-                    print(
-                        "##############    BOOKED!  ############################    BOOKED!  ##############"
-                    )
-                    print(
-                        "                        Hey, Hey, Hey! It's your lucky day!                       "
-                    )
-                    # requests.put("https://kvdb.io/thofdz57BqhTCaiBphDCp/" + str(uuid.uuid4()), data={})
-                    pause("\nPress any key thrice to exit program.", 3)
-                    sys.exit()
-
-                elif resp.status_code == 400:
-                    print(f"Response: {resp.status_code} : {resp.text}")
-                    pass
+                outcome = classify_booking_response(resp)
+                self.captcha_solvers.feedback(captcha, outcome)
+                if outcome == BOOKED:
+                    return self.on_booked(details)
+
+                print(f"Response: {resp.status_code} ({outcome}) : {resp.text}")
+                action = self.recover(outcome, details)
+                if action == 'retry' and retries < BOOKING_MAX_RETRIES:
+                    retries += 1
+                    continue
+                if action == 'stop':
+                    return True
+                details, retries = next(fallbacks, None), 0
+            return True
+
+        except Exception as e:
+            print(str(e))
+            self.alerts.warning(str(e))
+
 
+    @cached_property
+    def booking_executor(self):
+        return ThreadPoolExecutor(
+            max_workers=max(1, self.race_size),
+            thread_name_prefix=f'BookingRace-{self.mobile}',
+        )
+
+    def race_attempt(self, details, won, delay=0):
+        if won.wait(delay):
+            return details, None    # booked meanwhile, not sent
+        with span('booking', mode='race'):
+            resp = self.client.post_booking(json=details)
+        if resp.status_code == 200:
+            won.set()
+        return details, resp
+
+    def cancel_bookings(self, bookings):
+        """
+        This function cancels the appointments of (details, booking response), alerting when one cannot be cancelled
+        """
+        for details, resp in bookings:
+            try:
+                appointment_id = resp.json()['appointment_confirmation_no']
+                cancel = self.client.post_cancel(json={
+                    'appointment_id': appointment_id,
+                    'beneficiariesToCancel': details['beneficiaries'],
+                })
+                log.info(f"Cancel Response Code ({appointment_id}): {cancel.status_code}")
+                cancel.raise_for_status()
+            except Exception as e:
+                log.error(f"Unable to cancel the extra booking of session {details['session_id']}: {e}")
+                self.alerts.warning(f"Extra booking of session {details['session_id']} not cancelled, cancel it on CoWIN")
+
+    def race_booking(self, candidates, fallbacks=()):
+        """
+        This function
+            1. Gets a captcha for every candidate concurrently (automated solving only, see attempt_booking),
+            2. Sends the booking requests in rank order BOOKING_RACE_STAGGER seconds apart, requests
+               not yet sent are dropped once one books, and extra bookings of requests already in flight
+               are cancelled,
+            3. Continues one at a time with the candidates still bookable, then the fallbacks, if none was booked, and
+            4. Returns True or False depending on Token Validity
+
+        Racing assumes CoWIN honours every unexpired captcha issued to the token; if it only honours
+        the latest one, all but one attempt fail on the captcha and race_size should stay 1.
+        """
+        try:
+            captchas = list(self.booking_executor.map(lambda _: self.generate_captcha(), candidates))
+            attempts = [
+                dict(details, captcha=captcha)
+                for details, captcha in zip(candidates, captchas)
+                if captcha and self.still_listed(details)
+            ]
+
+            print(
+                f"================================= RACING {len(attempts)} BOOKINGS =================================================="
+            )
+            won = threading.Event()
+            futures = [
+                self.booking_executor.submit(self.race_attempt, details, won, rank * BOOKING_RACE_STAGGER)
+                for rank, details in enumerate(attempts)
+            ]
+            booked, actions, retry = [], set(), []
+            for future in as_completed(futures):
+                details, resp = future.result()
+                if resp is None:
+                    continue
+                log.info(f"Booking Response Code ({details['session_id']}): {resp.status_code}")
+                log.info(f"Booking Response : {resp.text}")
+                outcome = classify_booking_response(resp)
+                self.captcha_solvers.feedback(details['captcha'], outcome)
+                if outcome == BOOKED:
+                    booked.append((details, resp))
+                    continue
+                print(f"Response: {resp.status_code} ({outcome}) : {resp.text}")
+                if outcome in UNAVAILABLE:
+                    self.mark_unavailable(details['session_id'])
                 else:
-                    print(f"Response: {resp.status_code} : {resp.text}")
+                    actions.add(outcome)
+                    retry.append(details)
+            self.captcha_pool.resume()
+
+            if booked:
+                # requests already in flight cannot be recalled: keep the best ranked booking
+                booked.sort(key=lambda booking: attempts.index(booking[0]))
+                self.cancel_bookings(booked[1:])
+                return self.on_booked(booked[0][0])
+
+            # one recovery for the whole race, e.g. a single re-auth or back off
+            for outcome in (RATE_LIMITED, TOKEN_EXPIRED, UNKNOWN):
+                if outcome in actions and self.recover(outcome, retry[0]) == 'stop':
                     return True
+            remaining = chain(retry, fallbacks)
+            details = next(remaining, None)
+            return self.book_appointment(details, remaining) if details is not None else True
 
         except Exception as e:
             print(str(e))
-            beep(WARNING_BEEP_DURATION[0], WARNING_BEEP_DURATION[1])
+            self.alerts.warning(str(e))
+
+    def rank_options(self, options):
+        """
+        This function ranks the bookable options, lists the best RANK_TOP_K on the dashboard and returns them
+        """
+        with span('rank'):
+            ranked = self.ranker.top(self.bookable(options))
+        self.dashboard.update_options(ranked, group=self.mobile)
+        return ranked
 
+    def attempt_booking(self, ranked, new_req):
+        """
+        This function books `new_req`, falling back to the next `ranked` options, or races the
+        best `race_size` options when racing is enabled and captchas are solved automatically;
+        the user would have to type every captcha of a race before anything is sent
+        """
+        if self.race_size > 1 and self.info.captcha_automation:
+            return self.race_booking(
+                list(self.booking_requests(ranked[:self.race_size])),
+                self.booking_requests(ranked[self.race_size:]),
+            )
+        return self.book_appointment(
+            new_req,
+            self.booking_requests(option for option in ranked if option.session_id != new_req['session_id']),
+        )
+
+    def build_booking_request(self, ranked):
+        """
+        This function returns the booking request for a random slot of the best ranked option,
+        None if there is nothing to book
+        """
+        if len(ranked) == 0:
+            return None
+
+        best = ranked[0]
+        slot = random.choice(best.slots)
+        print(f"============> Got Choice: Center {best.center_id}, Slot {slot}")
+        return dict(
+            self.booking_payload,
+            center_id=best.center_id,
+            session_id=best.session_id,
+            slot=slot,
+        )
 
     def check_and_book(self, **kwargs):
         """
@@ -238,72 +729,22 @@ class BookingClient(object):
         """
         try:
 
-            if self.info.search_option == 2:
-                options = self.check_calendar_by_district()
-            else:
-                options = self.check_calendar_by_pincode()
+            options = self.check_calendar()
 
             if isinstance(options, bool):
                 return False
 
-            options = sorted(
-                options,
-                key=lambda k: (
-                    k["district"].lower(),
-                    k["pincode"],
-                    k["name"].lower(),
-                    datetime.datetime.strptime(k["date"], "%d-%m-%Y"),
-                ),
-            )
-
-            if len(options) > 0:
-                # display_table(cleaned_options_for_display)
-                display_table([{k:v for k, v in opt.items() if k not in ('session_id', 'center_id')} for opt in options])
-                randrow = random.randint(1, len(options))
-                randcol = random.randint(1, len(options[randrow - 1]["slots"]))
-                choice = str(randrow) + "." + str(randcol)
-                print("Random Rows.Column:" + choice)
+            options = self.rank_options(options or [])
+            new_req = self.build_booking_request(options)
 
-            else:
-                for i in range(self.info.refresh_freq, 0, -1):
-                    print(f"No viable options. Next update in {i} seconds..", end="\r", flush=True)
-                    sys.stdout.flush()
-                    time.sleep(1)
-                choice = "."
+            if new_req is None:
+                self.wait_for_next_cycle()
+                return True
 
         except TimeoutOccurred:
             time.sleep(1)
             return True
 
         else:
-            if choice == ".":
-                return True
-            else:
-                try:
-                    choice = choice.split(".")
-                    choice = [int(item) for item in choice]
-                    print(
-                        f"============> Got Choice: Center #{choice[0]}, Slot #{choice[1]}"
-                    )
-
-                    new_req = {
-                        "beneficiaries": [
-                            beneficiary["bref_id"] for beneficiary in self.info.beneficiary_ls
-                        ],
-                        "dose": 2
-                        if [beneficiary["status"] for beneficiary in self.info.beneficiary_ls][0]
-                        == "Partially Vaccinated"
-                        else 1,
-                        "center_id": options[choice[0] - 1]["center_id"],
-                        "session_id": options[choice[0] - 1]["session_id"],
-                        "slot": options[choice[0] - 1]["slots"][choice[1] - 1],
-                    }
-
-                    print(f"Booking with info: {new_req}")
-                    return self.book_appointment(new_req)
-
-                except IndexError:
-                    print("============> Invalid Option!")
-                    pause()
-                    pass
-
+            print(f"Booking with info: {new_req}")
+            return self.attempt_booking(options, new_req)
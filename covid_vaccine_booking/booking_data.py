@@ -18,6 +18,7 @@ from .utils import (
 from .config import (
     DATA_FILENAME_FORMAT,
     DATA_FILENAME_DIR,
+    RANKING,
 )
 
 class BookingData(object):
@@ -34,11 +35,16 @@ class BookingData(object):
     auto_book: str
     captcha_automation: bool
     captcha_automation_api_key: Union[type(None), str]
+    preferred_pincodes: List[int] = []
+    preferred_centers: List[int] = []
+    home_pincode: Union[type(None), int] = None
+    ranking: List[str] = list(RANKING)
 
     DATA_ATTRS = (
         'beneficiary_ls', 'location_ls', 'location_blocks', 'search_option',
         'minimum_slots', 'refresh_freq', 'auto_book','start_date', 'vaccine_type',
         'fee_type', 'captcha_automation', 'captcha_automation_api_key',
+        'preferred_pincodes', 'preferred_centers', 'home_pincode', 'ranking',
     )
 
 
@@ -48,10 +54,12 @@ class BookingData(object):
     collection_data = {}
 
     def __init__(self, mobile, cowin_client, **kwargs):
-        if 'data' in kwargs:
-            self.data = kwargs['data']
         self.mobile = mobile
         self.client = cowin_client
+        if kwargs.get('data') is not None:
+            # pre-collected info (e.g. benchmarks), skip the prompts
+            self.data = kwargs['data']
+            return
         filename = DATA_FILENAME_DIR + DATA_FILENAME_FORMAT.format(mobile=mobile)
         filename =  os.path.expandvars(os.path.expanduser(filename))
         # print(filename)
@@ -297,6 +305,21 @@ class BookingData(object):
 
 
 
+    def get_ranking_preference(self):
+        home_pincode = input("\nHome pincode, to prefer nearby centers? (Default none) : ")
+        self.collection_data['home_pincode'] = int(home_pincode) if home_pincode.strip().isdigit() else None
+
+        pincodes = input("Comma separated pincodes to prefer over others? (Default none) : ")
+        self.collection_data['preferred_pincodes'] = [
+            int(pincode) for pincode in pincodes.replace(' ', '').split(",") if pincode.isdigit()
+        ]
+        centers = input("Comma separated center ids to prefer over others (center_id in booking info)? (Default none) : ")
+        self.collection_data['preferred_centers'] = [
+            int(center) for center in centers.replace(' ', '').split(",") if center.isdigit()
+        ]
+        self.collection_data['ranking'] = list(RANKING)
+        return self.collection_data['ranking']
+
     def collect_user_details(self):
         self.collection_data = {}
         # Get Beneficiaries
@@ -354,6 +377,9 @@ class BookingData(object):
         # Get preference of Free/Paid option
         fee_type = self.get_fee_type_preference()
 
+        # Get ranking preferences
+        self.get_ranking_preference()
+
         print(
             "\n=========== CAUTION! =========== CAUTION! CAUTION! =============== CAUTION! =======\n"
             "===== BE CAREFUL WITH THIS OPTION! AUTO-BOOKING WILL BOOK THE FIRST AVAILABLE CENTRE, DATE, AND A RANDOM SLOT! ====="
@@ -0,0 +1,64 @@
+"""
+Module classifies booking responses so each failure gets its fastest recovery.
+"""
+import re
+
+BOOKED = 'booked'
+CAPTCHA_WRONG = 'captcha_wrong'         # retry the same slot with a new captcha
+SLOT_FULL = 'slot_full'                 # move on to the next ranked option
+SESSION_CLOSED = 'session_closed'       # move on to the next ranked option
+TOKEN_EXPIRED = 'token_expired'         # re-authenticate, retry the same slot
+RATE_LIMITED = 'rate_limited'           # back off
+UNKNOWN = 'unknown'
+
+# sessions known to be gone, never worth another booking request from the same snapshot
+UNAVAILABLE = frozenset([SLOT_FULL, SESSION_CLOSED])
+
+# outcomes confirming the captcha answer; only a booking does, whether the server checks the
+# captcha before capacity (SLOT_FULL would then confirm it too) is not known
+CAPTCHA_ACCEPTED = frozenset([BOOKED])
+
+# errorCodes seen in CoWIN booking responses, anything else is classified by its message
+ERROR_CODES = {
+    'APPOIN0040': SLOT_FULL,
+}
+
+# checked in order: token before session, "Token expired" must re-authenticate, not skip the session
+ERROR_PATTERNS = (
+    (re.compile(r"unauthenticated|unauthori[sz]ed|\b(?:invalid|expired) (?:access )?token|token (?:has )?(?:expired|invalid)", re.I), TOKEN_EXPIRED),
+    (re.compile(r"captcha|security code", re.I), CAPTCHA_WRONG),
+    (re.compile(r"(?:completely|fully) booked|no (?:slots?|capacity)|not enough (?:slots?|capacity)|"
+                r"(?:insufficient|no) (?:available )?capacity|capacity (?:is )?(?:full|exhausted|not available)", re.I), SLOT_FULL),
+    (re.compile(r"session (?:is |has )?(?:closed|expired|ended|not (?:active|available|found))|"
+                r"slot (?:is )?not available|(?:center|centre) (?:is )?closed|past (?:date|session)", re.I), SESSION_CLOSED),
+)
+
+
+def classify_booking_response(resp):
+    """
+    This function returns the outcome class of a booking response, from its status code,
+    CoWIN errorCode or, failing those, its error message
+    """
+    if resp.status_code == 200:
+        return BOOKED
+    if resp.status_code == 401:
+        return TOKEN_EXPIRED
+    if resp.status_code == 429:
+        return RATE_LIMITED
+    if resp.status_code == 409:
+        return SLOT_FULL
+
+    try:
+        body = resp.json()
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    if body.get('errorCode') in ERROR_CODES:
+        return ERROR_CODES[body['errorCode']]
+
+    message = str(body.get('error') or resp.text)
+    for pattern, outcome in ERROR_PATTERNS:
+        if pattern.search(message):
+            return outcome
+    return UNKNOWN
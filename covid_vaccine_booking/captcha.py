@@ -1,44 +1,168 @@
+import io
+import re
+import time
+import queue
+import threading
+from concurrent.futures import Future, InvalidStateError
 from svglib.svglib import svg2rlg
 from reportlab.graphics import renderPM
 import PySimpleGUI as sg
-import re
-from PIL import Image
 from anticaptchaofficial.imagecaptcha import imagecaptcha
+from .metrics import span
 
-def captcha_builder(resp):
-    with open('captcha.svg', 'w') as f:
-        f.write(re.sub('(<path d=)(.*?)(fill="none"/>)', '', resp['captcha']))
+# noise lines drawn over the captcha glyphs
+CAPTCHA_NOISE = re.compile('(<path d=)(.*?)(fill="none"/>)')
 
-    drawing = svg2rlg('captcha.svg')
-    renderPM.drawToFile(drawing, "captcha.png", fmt="PNG")
 
-    im = Image.open('captcha.png')
-    im = im.convert('RGB').convert('P', palette=Image.ADAPTIVE)
-    im.save('captcha.gif')
+def strip_noise(svg):
+    return CAPTCHA_NOISE.sub('', svg)
 
-    layout = [[sg.Image('captcha.gif')],
-          [sg.Text("Enter Captcha Below")],
-          [sg.Input()],
-          [sg.Button('Submit', bind_return_key=True)]]
 
-    window = sg.Window('Enter Captcha', layout)
-    event, values = window.read()
-    window.close()
-    return values[1]
+def render_captcha(svg, fmt="PNG"):
+    """
+    This function renders captcha svg text to image bytes in `fmt`, entirely in memory
+    """
+    with span('captcha_render'):
+        drawing = svg2rlg(io.BytesIO(strip_noise(svg).encode('utf-8')))
+        return renderPM.drawToString(drawing, fmt=fmt)
 
 
-def captcha_builder_auto(resp, api_key):
-    with open('captcha.svg', 'w') as f:
-        f.write(re.sub('(<path d=)(.*?)(fill=\"none\"/>)', '', resp['captcha']))
+class CaptchaWindow(object):
+    """
+    One captcha entry window for the whole run.
+
+    Tk only works from the main thread (macOS enforces it), so the window is created and
+    driven by `pump`, called from the main thread. `ask` may be called from any thread: it
+    queues a rendered captcha and returns a Future of the typed answer. Captchas are shown
+    one at a time, a cancelled Future is skipped. Closing the window answers None to every
+    captcha waiting, the next captcha opens it again.
+    """
+
+    def __init__(self, title='Enter Captcha'):
+        self.title = title
+        self._requests = queue.Queue()
+        self._window = None
+        self._current = self._shown = None
+
+    @staticmethod
+    def on_gui_thread():
+        return threading.current_thread() is threading.main_thread()
+
+    def ask(self, image):
+        """
+        This function queues captcha image bytes (PNG) and returns a Future of the answer
+        """
+        future = Future()
+        self._requests.put((image, future))
+        return future
+
+    def open(self):
+        if self._window is None:
+            layout = [[sg.Image(key='-IMAGE-', visible=False)],
+                  [sg.Text("Waiting for the next captcha..", key='-STATUS-', size=(30, 1))],
+                  [sg.Input(key='-ANSWER-')],
+                  [sg.Button('Submit', bind_return_key=True)]]
+            self._window = sg.Window(self.title, layout, finalize=True, keep_on_top=True)
+        return self._window
+
+    def _next(self):
+        while True:
+            try:
+                image, future = self._requests.get_nowait()
+            except queue.Empty:
+                return None
+            if not future.done():
+                return image, future
+
+    @staticmethod
+    def _answer(future, answer):
+        try:
+            future.set_result(answer)
+        except InvalidStateError:
+            pass    # cancelled meanwhile
+
+    def _show(self, window, current):
+        # Tk 8.6 shows PNG directly, no GIF conversion needed
+        if current:
+            window['-IMAGE-'].update(data=current[0], visible=True)
+        else:
+            window['-IMAGE-'].update(visible=False)
+        window['-STATUS-'].update("Enter Captcha Below" if current else "Waiting for the next captcha..")
+        window['-ANSWER-'].update('')
+        if current:
+            window['-ANSWER-'].set_focus()
+            window.bring_to_front()
 
-    drawing = svg2rlg('captcha.svg')
-    renderPM.drawToFile(drawing, "captcha.png", fmt="PNG")
+    def _close(self):
+        self._window.close()
+        self._window = self._shown = None
+        while self._current:
+            self._answer(self._current[1], None)
+            self._current = self._next()
+
+    def pump(self, timeout=0):
+        """
+        This function handles window events for up to `timeout` seconds and shows the next
+        queued captcha once the current one is answered or given up; main thread only
+        """
+        if self._window is None and self._current is None and self._requests.empty():
+            time.sleep(timeout)     # no window to keep responsive
+            return
+        window = self.open()
+        event, values = window.read(timeout=int(timeout * 1000))
+        if event == sg.WIN_CLOSED:
+            self._close()
+            return
+        if self._current and event == 'Submit':
+            self._answer(self._current[1], values['-ANSWER-'])
+        if self._current is None or self._current[1].done():
+            # answered, or given up by the caller (e.g. the slot is gone)
+            self._current = self._next()
+        if self._current is not self._shown:
+            self._show(window, self._current)
+            self._shown = self._current
+
+    def wait(self, future, interval=0.1):
+        """
+        This function returns the answer of `future`, driving the window meanwhile when on the main thread
+        """
+        while not future.done():
+            if self.on_gui_thread():
+                self.pump(interval)
+            else:
+                time.sleep(interval)
+        return future.result()
+
+
+_window = None
+_window_lock = threading.Lock()
+
+
+def get_captcha_window():
+    """
+    This function returns the process wide captcha window
+    """
+    global _window
+    with _window_lock:
+        if _window is None:
+            _window = CaptchaWindow()
+        return _window
+
+
+def captcha_builder(resp):
+    with span('captcha_solve', solver='manual'):
+        window = get_captcha_window()
+        return window.wait(window.ask(render_captcha(resp['captcha'])))
+
+
+def captcha_builder_auto(resp, api_key):
+    image = render_captcha(resp['captcha'])
 
-    
     solver = imagecaptcha()
     solver.set_verbose(1)
     solver.set_key(api_key)
-    captcha_text = solver.solve_and_return_solution("captcha.png")
+    with span('captcha_solve', solver='anticaptcha'):
+        captcha_text = solver.solve_and_return_solution(None, body=image)
 
     if captcha_text != 0:
         print(f"Captcha text: {captcha_text}")
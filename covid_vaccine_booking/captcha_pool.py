@@ -0,0 +1,117 @@
+"""
+Module defines a pool of pre-fetched (and where possible pre-solved) captchas.
+
+A background thread keeps up to `size` captchas younger than `ttl`, so booking does not
+have to fetch, render and solve a captcha after a slot appears. It only refills while
+`want` was called within `ttl` (i.e. while viable options are listed), so no captcha is
+fetched or paid for while nothing is bookable. CoWIN may only honour the latest captcha
+issued to a token, so refills pause from `take` until `resume` (the booking response).
+"""
+import time
+import threading
+from collections import deque
+from typing import NamedTuple, Optional
+
+from .logger import log
+from .config import (
+    CAPTCHA_POOL_SIZE,
+    CAPTCHA_POOL_TTL,
+)
+
+
+class PooledCaptcha(NamedTuple):
+    captcha: dict                   # getRecaptcha response
+    answer: Optional[str]           # None when it still needs a (manual) solve
+    fetched_at: float
+
+
+class CaptchaPool(object):
+    """
+    `fetch` returns a getRecaptcha response, `solve` (optional) turns its json into the answer;
+    with `require_answer` captchas `solve` fails on are dropped, otherwise kept for a manual solve.
+    """
+
+    def __init__(self, fetch, solve=None, size=CAPTCHA_POOL_SIZE, ttl=CAPTCHA_POOL_TTL, interval=1, require_answer=True):
+        self.fetch = fetch
+        self.solve = solve
+        self.require_answer = require_answer
+        self.size = size
+        self.ttl = ttl
+        self.interval = interval
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = False
+        self._wanted_until = 0
+        self._paused_at = None
+
+    def start(self):
+        if self._thread is None and self.size > 0:
+            self._thread = threading.Thread(target=self._run, name='CaptchaPoolThread', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+
+    def want(self):
+        """
+        This function keeps the pool filled for another `ttl` seconds
+        """
+        self._wanted_until = time.time() + self.ttl
+
+    def resume(self):
+        self._paused_at = None
+
+    def _refilling(self, now):
+        if self._paused_at is not None and now - self._paused_at >= self.ttl:
+            self._paused_at = None  # booking never reported back, the taken captcha is stale anyway
+        return self._paused_at is None and now < self._wanted_until
+
+    def _prune(self, now):
+        with self._lock:
+            while self._items and now - self._items[0].fetched_at >= self.ttl:
+                self._items.popleft()
+            return len(self._items)
+
+    def _fill_one(self):
+        resp = self.fetch()
+        if resp.status_code != 200:
+            log.debug(f"Captcha pool fetch failed: {resp.status_code}")
+            return False
+        fetched_at = time.time()
+        captcha = resp.json()
+        answer = (self.solve(captcha) or None) if self.solve else None
+        if self.solve and self.require_answer and answer is None:
+            return False
+        with self._lock:
+            self._items.append(PooledCaptcha(captcha, answer, fetched_at))
+        return True
+
+    def _run(self):
+        while not self._stop:
+            try:
+                now = time.time()
+                if self._prune(now) < self.size and self._refilling(now):
+                    if self._fill_one():
+                        continue
+            except Exception as e:
+                log.debug(f"Captcha pool refill failed: {e}")
+            time.sleep(self.interval)
+
+    def take(self):
+        """
+        This function returns the freshest pooled captcha still within its validity window, None if empty;
+        refills pause until `resume` so the captcha is still the latest one when it is sent
+        """
+        now = time.time()
+        self._paused_at = now
+        with self._lock:
+            while self._items:
+                item = self._items.pop()
+                if now - item.fetched_at < self.ttl:
+                    return item
+        return None
+
+    def __len__(self):
+        return self._prune(time.time())
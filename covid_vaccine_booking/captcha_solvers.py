@@ -0,0 +1,250 @@
+"""
+Module defines the captcha solver abstraction: several solvers raced or voted within a deadline.
+
+Automated solvers are started in order of their track record (reliable first, then fastest);
+the next one is started when the previous gave up, or as a hedge when it is slow. The manual
+prompt is the last resort. Booking outcomes are fed back to track per solver accuracy, and
+captchas of successful bookings teach the local glyph index.
+"""
+import time
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .logger import log
+from .metrics import observe
+from .captcha import captcha_builder_auto, get_captcha_window, render_captcha
+from .glyph_solver import GlyphIndex, solve_glyphs, get_index
+from .booking_errors import CAPTCHA_ACCEPTED, CAPTCHA_WRONG
+from .config import (
+    CAPTCHA_SOLVE_MODE,
+    CAPTCHA_SOLVE_DEADLINE,
+    CAPTCHA_HEDGE_DELAY,
+    CAPTCHA_MIN_ACCURACY,
+    GLYPH_INDEX_FILE,
+)
+
+
+class SolverStats(object):
+
+    def __init__(self):
+        self.attempts = 0
+        self.answers = 0
+        self.correct = 0
+        self.wrong = 0
+        self.total_latency = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency, answered):
+        with self._lock:
+            self.attempts += 1
+            self.answers += bool(answered)
+            self.total_latency += latency
+
+    def feedback(self, accepted):
+        with self._lock:
+            if accepted:
+                self.correct += 1
+            else:
+                self.wrong += 1
+
+    @property
+    def accuracy(self):
+        judged = self.correct + self.wrong
+        return self.correct / judged if judged else 1.0
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.attempts if self.attempts else 0.0
+
+    def summary(self):
+        return {
+            'attempts': self.attempts,
+            'answers': self.answers,
+            'accuracy': round(self.accuracy, 3),
+            'mean_latency': round(self.mean_latency, 3),
+        }
+
+
+class GlyphSolver(object):
+    name = 'glyphs'
+    manual = False
+
+    def __call__(self, captcha):
+        return solve_glyphs(captcha)
+
+
+class AntiCaptchaSolver(object):
+    name = 'anticaptcha'
+    manual = False
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def __call__(self, captcha):
+        return captcha_builder_auto(captcha, self.api_key) or None
+
+
+class ManualSolver(object):
+    """
+    Asks the user through the captcha window; `while_waiting` is called every `interval`
+    seconds until the answer is typed, e.g. to keep the calendar fresh. On the main thread the
+    solver drives the window and runs `while_waiting` on a worker, so typing never stalls;
+    elsewhere the main thread has to pump the window (see AsyncBookingClient). The window
+    only opens for the first captcha asked, runs that never book need no display.
+    """
+    name = 'manual'
+    manual = True
+
+    def __init__(self, while_waiting=None, interval=0.1):
+        self.while_waiting = while_waiting
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='CaptchaWait')
+
+    def _while_waiting(self):
+        try:
+            self.while_waiting()
+        except Exception as e:
+            log.debug(f"Captcha wait hook failed: {e}")
+
+    def __call__(self, captcha):
+        window = get_captcha_window()
+        future = window.ask(render_captcha(captcha['captcha']))
+        pumping = window.on_gui_thread()
+        poller = None
+        try:
+            while not future.done():
+                if pumping:
+                    window.pump(self.interval)
+                else:
+                    wait([future], timeout=self.interval)
+                if self.while_waiting and not future.done():
+                    if not pumping:
+                        self._while_waiting()
+                    elif poller is None or poller.done():
+                        poller = self.executor.submit(self._while_waiting)
+            return future.result() or None
+        finally:
+            future.cancel()
+            if pumping:
+                window.pump()   # off the screen, the booking may take a while
+
+
+class CaptchaSolvers(object):
+    """
+    Solves with `solvers` in mode 'first' (first confident answer wins) or 'vote'
+    (majority of the automated answers given within the deadline).
+    """
+
+    def __init__(self, solvers, mode=CAPTCHA_SOLVE_MODE, deadline=CAPTCHA_SOLVE_DEADLINE,
+                 hedge_delay=CAPTCHA_HEDGE_DELAY):
+        self.solvers = list(solvers)
+        self.mode = mode
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.stats = {solver.name: SolverStats() for solver in self.solvers}
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.solvers)), thread_name_prefix='CaptchaSolver')
+        self._solutions = OrderedDict()     # answer -> (solver names, captcha), awaiting feedback
+        self._lock = threading.Lock()
+
+    def ranked(self):
+        """
+        This function orders solvers reliable first, then by mean latency (stable for untried solvers)
+        """
+        def key(solver):
+            stats = self.stats[solver.name]
+            return (stats.accuracy < CAPTCHA_MIN_ACCURACY, stats.mean_latency)
+        return sorted(self.solvers, key=key)
+
+    def _run(self, solver, captcha):
+        started = time.perf_counter()
+        answer = None
+        try:
+            answer = solver(captcha)
+        except Exception as e:
+            log.debug(f"Captcha solver {solver.name} failed: {e}")
+        latency = time.perf_counter() - started
+        self.stats[solver.name].record(latency, answer)
+        observe('captcha_solver', latency, solver=solver.name, answered=bool(answer))
+        return solver.name, answer
+
+    def _first(self, captcha, solvers):
+        queue, pending = list(solvers), set()
+        deadline = time.monotonic() + self.deadline
+        while queue or pending:
+            if queue:
+                pending.add(self.executor.submit(self._run, queue.pop(0), captcha))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(
+                pending, timeout=min(self.hedge_delay, remaining) if queue else remaining,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                name, answer = future.result()
+                if answer:
+                    return answer, (name,)
+        return None, ()
+
+    def _vote(self, captcha, solvers):
+        futures = [self.executor.submit(self._run, solver, captcha) for solver in solvers]
+        done, _ = wait(futures, timeout=self.deadline)
+        answers = [future.result() for future in done if future.result()[1]]
+        if not answers:
+            return None, ()
+        votes = Counter(answer for _, answer in answers)
+        answer, count = votes.most_common(1)[0]
+        if count * 2 <= len(answers):
+            # no majority, trust the most accurate solver
+            answer = max(answers, key=lambda item: self.stats[item[0]].accuracy)[1]
+        return answer, tuple(name for name, given in answers if given == answer)
+
+    def solve(self, captcha, manual=True):
+        """
+        This function returns the captcha answer, None if no solver managed within the deadline;
+        the manual prompt only runs (in the calling thread) when the automated solvers failed
+        """
+        ranked = self.ranked()
+        automated = [solver for solver in ranked if not solver.manual]
+        solve = self._vote if self.mode == 'vote' else self._first
+        answer, names = solve(captcha, automated) if automated else (None, ())
+        if answer is None and manual:
+            for solver in ranked:
+                if solver.manual:
+                    name, answer = self._run(solver, captcha)
+                    names = (name,)
+                    if answer:
+                        break
+        if answer:
+            with self._lock:
+                self._solutions[answer] = (names, captcha)
+                while len(self._solutions) > 50:
+                    self._solutions.popitem(last=False)
+        return answer
+
+    def solve_automated(self, captcha):
+        return self.solve(captcha, manual=False)
+
+    def feedback(self, answer, outcome):
+        """
+        This function scores the solvers behind `answer` from the booking outcome; captchas the
+        server accepted (a booking was made) but the glyph solver could not read are learned by
+        its index, whether or not the glyph solver is enabled
+        """
+        accepted = outcome in CAPTCHA_ACCEPTED
+        if not accepted and outcome != CAPTCHA_WRONG:
+            return      # other failures say nothing about the captcha
+        with self._lock:
+            names, captcha = self._solutions.pop(answer, ((), None))
+        for name in names:
+            self.stats[name].feedback(accepted)
+        if accepted and captcha and GlyphSolver.name not in names:
+            if get_index().learn(captcha['captcha'], answer):
+                # the local file only keeps learned glyphs, the packaged ones stay separate
+                learned = GlyphIndex.load(GLYPH_INDEX_FILE)
+                learned.learn(captcha['captcha'], answer)
+                learned.save(GLYPH_INDEX_FILE)
+
+    def summary(self):
+        return {name: stats.summary() for name, stats in self.stats.items()}
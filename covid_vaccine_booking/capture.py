@@ -0,0 +1,213 @@
+"""
+Module defines record and replay of api traffic.
+
+CaptureWriter appends every request/response pair, with timing, to a gzip compressed
+json-lines file with tokens, OTPs and mobile numbers redacted. ReplayAdapter serves a
+capture back through a requests Session, instantly or at the recorded speed.
+"""
+import re
+import gzip
+import json
+import time
+import base64
+import threading
+from collections import defaultdict, deque
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+REDACTED = "REDACTED"
+REDACTED_MOBILE = "9000000000"
+
+# query params that change from run to run (calendars are polled for today's date),
+# left out when matching a replayed request against the capture
+VOLATILE_PARAMS = frozenset(['date'])
+
+REDACTED_HEADERS = frozenset(['authorization', 'cookie', 'set-cookie'])
+REDACTED_KEYS = frozenset(['token', 'txnId', 'otp', 'secret', 'mobile'])
+REDACTED_PATTERNS = (
+    (re.compile(r"Bearer\s+[\w.\-]+"), f"Bearer {REDACTED}"),
+    (re.compile(r"eyJ[\w\-]+\.[\w\-]+\.[\w\-]+"), REDACTED),                    # JWTs
+    (re.compile(r"(?<=CoWIN is )\d{6}"), "000000"),                             # OTP SMS
+    # mobile numbers, only where they are known to appear: bare digit runs are ids too (session, center, ..)
+    (re.compile(r'("(?:mobile|mobile_number|mobileNumber|phone)"\s*:\s*"?)[6-9]\d{9}(?!\d)'), rf"\g<1>{REDACTED_MOBILE}"),
+    (re.compile(r"(?<=[?&]mobile=)[6-9]\d{9}(?!\d)"), REDACTED_MOBILE),       # query string
+    (re.compile(r"(?<=/)[6-9]\d{9}(?=[/?#]|$)"), REDACTED_MOBILE),             # OTP storage url path
+)
+
+
+def redact_text(text):
+    for pattern, replacement in REDACTED_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def redact_value(value):
+    if isinstance(value, dict):
+        return {k: (REDACTED if k in REDACTED_KEYS else redact_value(v)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact_value(v) for v in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+def redact_headers(headers):
+    return {k: (REDACTED if k.lower() in REDACTED_HEADERS else redact_text(str(v))) for k, v in headers.items()}
+
+
+def encode_body(body, by_key=False):
+    """
+    This function returns (text, encoding) for a request/response body, redacted when it is text.
+    Response bodies are kept byte for byte (pattern redaction only) so they stay faithful profiling
+    fixtures, request bodies also have REDACTED_KEYS blanked
+    """
+    if body is None or body == b'':
+        return None, None
+    if isinstance(body, bytes):
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return base64.b64encode(body).decode('ascii'), 'base64'
+    if by_key:
+        try:
+            return json.dumps(redact_value(json.loads(body))), 'text'
+        except ValueError:
+            pass
+    return redact_text(body), 'text'
+
+
+def decode_body(text, encoding):
+    if text is None:
+        return b''
+    if encoding == 'base64':
+        return base64.b64decode(text)
+    return text.encode('utf-8')
+
+
+def request_key(method, url):
+    """
+    This function returns the (method, url) a request is matched by on replay,
+    the url redacted and without VOLATILE_PARAMS
+    """
+    parts = urlsplit(redact_text(url))
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in VOLATILE_PARAMS]
+    return method.upper(), urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class CaptureWriter(object):
+    """
+    Appends captured exchanges to `path`; every flush closes a gzip member, and gzip readers
+    concatenate members, so the file stays readable while capture is running.
+    """
+
+    def __init__(self, path, flush_every=20):
+        self.path = path
+        self.flush_every = flush_every
+        self.started = time.time()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def record(self, res):
+        request = res.request
+        request_body, request_encoding = encode_body(request.body, by_key=True)
+        response_body, response_encoding = encode_body(res.content)
+        entry = {
+            'at': round(time.time() - self.started, 6),
+            'elapsed': res.elapsed.total_seconds(),
+            'method': request.method,
+            'url': redact_text(request.url),
+            'request_headers': redact_headers(request.headers),
+            'request_body': request_body,
+            'request_encoding': request_encoding,
+            'status': res.status_code,
+            'headers': redact_headers(res.headers),
+            'body': response_body,
+            'encoding': response_encoding,
+        }
+        with self._lock:
+            self._pending.append(json.dumps(entry))
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            f.write("\n".join(self._pending) + "\n")
+        self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+
+def read_capture(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_bodies(path, endpoint):
+    """
+    This function yields the raw response bodies captured for urls containing `endpoint`,
+    e.g. iter_bodies(path, 'calendarByDistrict') for offline profiling of the calendar pipeline
+    """
+    for entry in read_capture(path):
+        if endpoint in entry['url'] and entry['status'] == 200:
+            yield decode_body(entry['body'], entry['encoding'])
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Serves captured responses by request_key, in recorded order per request, so a calendar
+    captured yesterday is served for today's date. When an url's captures run out, the last one
+    keeps being served, unknown urls get a 404.
+
+    `speed` None replays instantly (deterministic), 1.0 waits the recorded elapsed time
+    of every response, 2.0 twice as fast and so on.
+    """
+
+    def __init__(self, path, speed=None):
+        super().__init__()
+        self.speed = speed
+        self._entries = defaultdict(deque)
+        self._lock = threading.Lock()
+        for entry in read_capture(path):
+            self._entries[request_key(entry['method'], entry['url'])].append(entry)
+
+    def next_entry(self, method, url):
+        with self._lock:
+            entries = self._entries.get(request_key(method, url))
+            if not entries:
+                return None
+            return entries.popleft() if len(entries) > 1 else entries[0]
+
+    def send(self, request, **kwargs):
+        entry = self.next_entry(request.method, request.url)
+        if entry and self.speed:
+            time.sleep(entry['elapsed'] / self.speed)
+
+        res = Response()
+        res.request = request
+        res.url = request.url
+        res.reason = "Replayed"
+        res.elapsed = timedelta(seconds=entry['elapsed'] if entry else 0)
+        if entry is None:
+            res.status_code = 404
+            res._content = b'{"error": "Not in capture"}'
+            res.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        else:
+            res.status_code = entry['status']
+            res._content = decode_body(entry['body'], entry['encoding'])
+            res.headers = CaseInsensitiveDict(entry['headers'])
+            res.headers.pop('Content-Encoding', None)   # bodies are stored decoded
+        res.encoding = 'utf-8'
+        return res
+
+    def close(self):
+        pass
@@ -1,3 +1,56 @@
-STORAGE_URL_BASE = "https://kvdb.io/ASth4wnvVDPkg2bdjsiqMN/"
+import os
+
+# both can be pointed at the local stand-in server (see standin_server.py)
+COWIN_BASE_URL = os.environ.get("COWIN_BASE_URL", "https://cdn-api.co-vin.in/api/v2/")
+STORAGE_URL_BASE = os.environ.get("COWIN_STORAGE_URL_BASE", "https://kvdb.io/ASth4wnvVDPkg2bdjsiqMN/")
 DATA_FILENAME_FORMAT = "vaccine-booking-details-{mobile}.json"
-DATA_FILENAME_DIR = "~/"
\ No newline at end of file
+DATA_FILENAME_DIR = "~/"
+CALENDAR_MAX_WORKERS = 8
+CALENDAR_CYCLE_DEADLINE = 10 # seconds
+ASYNC_MAX_CONNECTIONS = 200
+CALENDAR_CACHE_TTL = 0 # seconds a calendar response is reused, 0 only merges identical requests in flight; keep below refresh_freq
+CALENDAR_CACHE_MAX_ENTRIES = 512
+CALENDAR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# CoWIN public apis allow 100 calls per 5 minutes per IP
+RATE_LIMIT_CALLS = 100
+RATE_LIMIT_PERIOD = 300 # seconds
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_MAX_FACTOR = 3
+RATE_LIMIT_MIN_FACTOR = 0.1
+CALENDAR_DECODER = 'auto' # 'auto', 'stream', 'json' or 'orjson'
+RANKING = ('preferred', 'earliest_date', 'nearest', 'highest_capacity')
+RANK_TOP_K = 10
+ALERT_SINKS = ('audio', 'desktop', 'webhook', 'file')
+ALERT_WEBHOOK_URL = None # e.g. "http://127.0.0.1:8080/alerts"
+ALERT_FILE = None # e.g. "alerts.log"
+ALERT_DEDUPE_TTL = 300 # seconds
+ALERT_QUEUE_SIZE = 100
+DASHBOARD_ENABLED = True
+DASHBOARD_FPS = 4
+METRICS_JSON_FILE = "cowin-metrics.json" # summary written at exit, None to disable
+METRICS_PROMETHEUS_FILE = None # e.g. "/var/lib/node_exporter/textfile/cowin.prom"
+METRICS_EXPORT_INTERVAL = 15 # seconds
+CAPTURE_FILE = None # e.g. "cowin-capture.jsonl.gz", records redacted api traffic
+REPLAY_FILE = None # serve a capture instead of the network
+REPLAY_SPEED = None # None replays instantly, 1.0 at recorded response times
+# CoWIN may only honour the latest captcha issued to a token, keep the pool small
+CAPTCHA_POOL_SIZE = 1 # 0 fetches captchas only when booking
+CAPTCHA_POOL_TTL = 60 # seconds a pooled captcha is trusted
+BOOKING_RACE_SIZE = 1 # sessions booked for at once with automated captchas, 1 books only the best ranked option
+BOOKING_RACE_STAGGER = 0.25 # seconds between raced booking requests, a booking cancels the ones not yet sent
+BOOKING_MAX_RETRIES = 3 # new captcha / token retries for the same slot before moving on
+BOOKING_UNAVAILABLE_TTL = 60 # seconds a session found full or closed is not booked again
+HTTP_POOL_MAXSIZE = 16 # connections kept per host, at least CALENDAR_MAX_WORKERS + BOOKING_RACE_SIZE
+HTTP_PREWARM_CONNECTIONS = 4 # connected at startup and kept connected while idle
+HTTP_KEEPALIVE_INTERVAL = 30 # seconds idle before pooled connections are checked and re-connected
+HTTP2_ENABLED = False # multiplex over one HTTP/2 connection, needs httpx[http2]
+GLYPH_INDEX_FILE = "~/cowin-captcha-glyphs.json" # glyphs learned from solved captchas, merged with the packaged index
+GLYPH_MATCH_THRESHOLD = 0.08 # max glyph distance (outline units of glyph height) for a confident solve
+CAPTCHA_LOCAL_SOLVER = False # try the offline glyph solver first; the packaged index is a stub (S N u v only), enable once GLYPH_INDEX_FILE learned the alphabet
+TOKEN_CACHE_FILE = "~/.cowin-tokens" # encrypted access tokens per mobile reused across restarts, None disables (needs cryptography)
+TOKEN_CACHE_KEY_FILE = "~/.cowin-tokens.key" # encryption key of the token cache, created on first use
+TOKEN_CACHE_MIN_VALIDITY = 30 # seconds a cached token must still be valid for to be reused
+CAPTCHA_SOLVE_MODE = 'first' # 'first' confident answer, or majority 'vote' of the automated solvers
+CAPTCHA_SOLVE_DEADLINE = 30 # seconds for the automated solvers, the manual prompt follows
+CAPTCHA_HEDGE_DELAY = 2 # seconds before also starting the next solver when one is slow
+CAPTCHA_MIN_ACCURACY = 0.8 # solvers below this are tried after the reliable ones
@@ -5,7 +5,14 @@ from typing import List
 
 
 from .cowin_session import CoWinSession
+from .response_cache import TTLCache
 from .utils import *
+from .config import (
+    COWIN_BASE_URL,
+    CALENDAR_CACHE_TTL,
+    CALENDAR_CACHE_MAX_ENTRIES,
+    CALENDAR_CACHE_MAX_BYTES,
+)
 
 
 
@@ -15,10 +22,11 @@ class CoWinClient(object):
     """
     mobile = None
 
-    base_url = 'https://cdn-api.co-vin.in/api/v2/'
+    base_url = COWIN_BASE_URL
 
     api = {
         'booking':              f"{base_url}appointment/schedule",
+        'cancel':               f"{base_url}appointment/cancel",
         'beneficiaries':        f"{base_url}appointment/beneficiaries",
         'states':               f"{base_url}admin/location/states",
         'districts':            f"{base_url}admin/location/districts/{{state_id}}",
@@ -31,6 +39,15 @@ class CoWinClient(object):
     }
     api_methods = ['get', 'post',]
 
+    # GET responses of these apis are shared by all clients in the process: requests in flight
+    # at the same time always, completed ones for CALENDAR_CACHE_TTL
+    cached_apis = ('calendar_by_district', 'calendar_by_pincode',)
+    response_cache = TTLCache(
+        ttl=CALENDAR_CACHE_TTL,
+        max_entries=CALENDAR_CACHE_MAX_ENTRIES,
+        max_bytes=CALENDAR_CACHE_MAX_BYTES,
+    )
+
     def __init__(self, mobile, *args, **kwargs):
         """
         constructor.
@@ -42,7 +59,10 @@ class CoWinClient(object):
         for api, url in self.api.items():
             for method in self.api_methods:
                 if not hasattr(self, f'{method}_{api}'):
-                    setattr(self, f'{method}_{api}', self._get_partial_api_method(method, url=url))
+                    if method == 'get' and api in self.cached_apis:
+                        setattr(self, f'{method}_{api}', self._get_cached_api_method(api, url=url))
+                    else:
+                        setattr(self, f'{method}_{api}', self._get_partial_api_method(method, url=url))
 
     def _get_partial_api_method(self, method, url,**kwargs):
 
@@ -50,6 +70,34 @@ class CoWinClient(object):
         if method:
             return partial(method, url=url, **kwargs)
 
+    def _get_cached_api_method(self, api, url, **kwargs):
+        """
+        This function wraps the partial GET method of api with response_cache,
+        keyed by (api, params, conditional headers) and only caching 200 responses; a 304 only
+        means something to callers that sent the same If-None-Match/If-Modified-Since.
+        Only requests that miss the cache are charged to the rate limit budget.
+        """
+        fetch = self._get_partial_api_method('get', url=url, **kwargs)
+
+        def load(params, **request_kwargs):
+            self.session.scheduler.charge(url)
+            return fetch(params=params, **request_kwargs)
+
+        def cached_fetch(params=None, **request_kwargs):
+            headers = request_kwargs.get('headers') or {}
+            key = (
+                api,
+                tuple(sorted((params or {}).items())),
+                tuple(headers.get(name) for name in ('If-None-Match', 'If-Modified-Since')),
+            )
+            return self.response_cache.get_or_load(
+                key,
+                loader=lambda: load(params, **request_kwargs),
+                cacheable=lambda resp: resp.status_code == 200,
+                sizeof=lambda resp: len(resp.content),
+            )
+        return cached_fetch
+
     def get_districts(self, state_id):
         url = self.api['districts']
         return self.session.get(url=url.format(state_id=state_id))
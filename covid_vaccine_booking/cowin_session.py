@@ -3,6 +3,7 @@ Module defines ADP client.
 """
 import os
 import json
+import socket
 import copy
 import time
 import base64
@@ -15,19 +16,83 @@ from requests.sessions import Session
 from requests.status_codes import codes
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from urllib3.exceptions import MaxRetryError
+from urllib3.util.connection import is_connection_dropped
 from collections import OrderedDict
 from os import curdir, sep
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
 import sys
+import atexit
 from .logger import log
+from .capture import CaptureWriter, ReplayAdapter
+from .http2_adapter import HTTP2Adapter, http2_available
+from .token_cache import TokenCache, token_cache_available
+from .scheduler import AdaptiveScheduler, BudgetExhausted, endpoint_key
+from .metrics import span, observe
 from .config import (
+    COWIN_BASE_URL,
     STORAGE_URL_BASE,
+    CAPTURE_FILE,
+    REPLAY_FILE,
+    REPLAY_SPEED,
+    HTTP_POOL_MAXSIZE,
+    HTTP_PREWARM_CONNECTIONS,
+    HTTP_KEEPALIVE_INTERVAL,
+    HTTP2_ENABLED,
+    TOKEN_CACHE_FILE,
 )
 
 class Custom_Retry(Retry):
     BACKOFF_MAX = 1
+    # throttled polls are handed back to the AdaptiveScheduler instead of being retried blindly
+    THROTTLE_PASSTHROUGH_METHODS = frozenset(["GET", "HEAD"])
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == codes.too_many_requests and method.upper() in self.THROTTLE_PASSTHROUGH_METHODS:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+# TCP keep-alive keeps NATs and firewalls from silently dropping pooled connections: probes start
+# after HTTP_KEEPALIVE_INTERVAL idle, where the platform lets us tune it (the OS default is hours)
+KEEPALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)] + [
+    (socket.IPPROTO_TCP, getattr(socket, option), value)
+    for option, value in (
+        ('TCP_KEEPIDLE', HTTP_KEEPALIVE_INTERVAL),      # Linux, Windows
+        ('TCP_KEEPALIVE', HTTP_KEEPALIVE_INTERVAL),     # macOS
+        ('TCP_KEEPINTVL', HTTP_KEEPALIVE_INTERVAL),
+        ('TCP_KEEPCNT', 3),
+    )
+    if hasattr(socket, option)
+]
+
+
+class TimedHTTPConnection(HTTPConnection):
+    default_socket_options = KEEPALIVE_SOCKET_OPTIONS
+
+    def connect(self):
+        # DNS resolution, TCP connect (and TLS handshake below) of new pool connections
+        with span('connect', host=self.host):
+            super().connect()
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    default_socket_options = KEEPALIVE_SOCKET_OPTIONS
+
+    def connect(self):
+        with span('connect', host=self.host):
+            super().connect()
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
 
 
 class TimeoutHTTPAdapter(HTTPAdapter):
@@ -40,18 +105,41 @@ class TimeoutHTTPAdapter(HTTPAdapter):
             del kwargs["timeout"]
         super().__init__(*args, **kwargs)
 
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
     def send(self, request, **kwargs):
         timeout = kwargs.get("timeout")
         if timeout is None:
             kwargs["timeout"] = self.timeout
         return super().send(request, **kwargs)
 
+    def prewarm(self, url, count=1):
+        """
+        This function makes sure `count` pooled connections to the host of `url` are connected,
+        replacing ones the server has closed, without sending any request. urllib3 has no public
+        api for this, _get_conn/_put_conn are stable across 1.26 (requirements.txt pins <2)
+        """
+        pool = self.poolmanager.connection_from_url(url)
+        conns = [pool._get_conn() for _ in range(count)]
+        for conn in conns:
+            if conn.sock is not None and is_connection_dropped(conn):
+                conn.close()
+            if conn.sock is None:
+                conn.connect()
+        for conn in conns:
+            pool._put_conn(conn)
+
 
 
 
 class CoWinSession(Session):
 
-    base_url = 'https://cdn-api.co-vin.in/api/v2/'
+    base_url = COWIN_BASE_URL
 
     api = {
         # 'booking':             f"{base_url}appointment/schedule",
@@ -82,7 +170,17 @@ class CoWinSession(Session):
     _otp_secrete = "U2FsdGVkX1+z/4Nr9nta+2DrVJSv7KS6VoQUSQ1ZXYDx/CJUkWxFYG6P3iM/VW+6jLQ9RDQVzp/RcZ8kbT41xw=="
 
     auth_thread = None
+    scheduler = AdaptiveScheduler()
+    capture_file = CAPTURE_FILE
+    replay_file = REPLAY_FILE
+    replay_speed = REPLAY_SPEED
+    capture = None
     _thread_stop_f: bool = False
+    keepalive_thread = None
+    _last_activity: float = 0
+    http2 = HTTP2_ENABLED
+    token_cache_file = TOKEN_CACHE_FILE
+    token_cache = None
 
     timeout = (2, 7)
     retry_obj = Custom_Retry(
@@ -103,14 +201,36 @@ class CoWinSession(Session):
         # self._otp_secrete = base64.b64encode(b'Salted__' + os.urandom(56)).decode('utf-8')
         # self._otp_secrete = base64.b64encode(b'Salted__' + secrets.token_bytes(56)).decode('utf-8')
         self.mobile = mobile
+        # per session, accounts booked from one process each have their own token and OTP
+        self._access_token_info = dict(token=None, expires=None)
+        self._txn_info = dict(txn_id=None, expires=None)
 
         self.headers.update({
             # 'user-agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:74.0) Gecko/20100101 Firefox/74.0',
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36',
         }),
-        adapter = TimeoutHTTPAdapter(timeout=self.timeout, max_retries=self.retry_obj)
+        if self.replay_file:
+            adapter = ReplayAdapter(self.replay_file, speed=self.replay_speed)
+        else:
+            adapter = TimeoutHTTPAdapter(
+                timeout=self.timeout, max_retries=self.retry_obj, pool_maxsize=HTTP_POOL_MAXSIZE,
+            )
         self.mount('https://', adapter)
         self.mount('http://', adapter)
+        if self.http2 and not self.replay_file:
+            if http2_available():
+                self.mount('https://', HTTP2Adapter(
+                    timeout=self.timeout, max_retries=self.retry_obj,
+                    max_connections=HTTP_POOL_MAXSIZE, keepalive_expiry=HTTP_KEEPALIVE_INTERVAL * 2,
+                ))
+            else:
+                log.warning("HTTP/2 needs `pip install httpx[http2]`, using HTTP/1.1")
+        if self.token_cache_file and not self.replay_file:
+            if token_cache_available():
+                self.token_cache = TokenCache(self.token_cache_file)
+                self.load_cached_access_token()
+            else:
+                log.warning("Caching access tokens needs `pip install cryptography`, every start asks for an OTP")
         self.auth_thread = threading.Thread(
             target=self.fetch_access_token_thread,
             args=(),
@@ -118,7 +238,18 @@ class CoWinSession(Session):
             daemon=True
         )
         self.auth_thread.start()
-
+        if not self.replay_file:
+            self.keepalive_thread = threading.Thread(
+                target=self.fetch_keepalive_thread,
+                args=(),
+                name='KeepAliveThread',
+                daemon=True
+            )
+            self.keepalive_thread.start()
+
+        if self.capture_file and not self.replay_file:
+            self.capture = CaptureWriter(self.capture_file)
+            atexit.register(self.capture.flush)
         self.hooks['response'].append(self.response_hook)
 
     def bearer_token_auth(self, request):
@@ -210,6 +341,7 @@ class CoWinSession(Session):
             token = data['token']
             self._access_token_info['token']   = token
             self._access_token_info['expires'] = datetime.now() + timedelta(seconds=self.TOKEN_VALID_TILL)
+            self.cache_access_token()
         else:
             log.error("Unable to Validate OTP")
             log.error(response.text)
@@ -219,6 +351,26 @@ class CoWinSession(Session):
         log.info(f"Token Generated: {token}")
         return token
 
+    def load_cached_access_token(self):
+        try:
+            cached = self.token_cache.load(self.mobile, self.base_url)
+        except Exception as exc:
+            log.warning(f"Unable to read the token cache: {exc}")
+            return False
+        if cached:
+            self._access_token_info['token'], self._access_token_info['expires'] = cached
+            log.info(f"Reusing cached access token, valid till {cached[1].strftime('%H:%M:%S')}")
+        return bool(cached)
+
+    def cache_access_token(self):
+        if self.token_cache:
+            try:
+                self.token_cache.store(
+                    self.mobile, self.base_url, self._access_token_info['token'], self._access_token_info['expires'],
+                )
+            except Exception as exc:
+                log.warning(f"Unable to save the token cache: {exc}")
+
     def _get_access_token(self):
         self.clear_storage_bucket()
         if self.generate_otp():
@@ -241,6 +393,18 @@ class CoWinSession(Session):
         while not self.is_access_token_valid:
             time.sleep(3)
 
+    def refresh_access_token(self, rejected=None):
+        # the server rejected a token we still consider valid, e.g. a cached one revoked meanwhile;
+        # `rejected` is the token sent, concurrent rejections of the same token refresh it once
+        if rejected is None or rejected == self._access_token_info['token']:
+            self._access_token_info['expires'] = datetime.now()
+            if self.token_cache:
+                try:
+                    self.token_cache.forget(self.mobile)
+                except Exception as exc:
+                    log.warning(f"Unable to update the token cache: {exc}")
+        self.get_access_token()
+
 
     def fetch_access_token_thread(self):
         while not self._thread_stop_f:
@@ -256,12 +420,52 @@ class CoWinSession(Session):
                 log.debug('Sleeping...')
                 time.sleep(5)
 
+    def prewarm(self, count=HTTP_PREWARM_CONNECTIONS):
+        adapter = self.get_adapter(self.base_url)
+        try:
+            with span('prewarm'):
+                if isinstance(adapter, HTTP2Adapter):
+                    # HTTP/2 prewarms with a HEAD request, the server counts it like any other
+                    self.scheduler.charge(self.base_url)
+                    self.scheduler.record(self.base_url, adapter.prewarm(self.base_url, count))
+                else:
+                    adapter.prewarm(self.base_url, count)
+        except BudgetExhausted:
+            log.debug("Connection prewarm skipped, rate limit budget exhausted")
+        except Exception as exc:
+            log.debug(f"Connection prewarm failed: {exc}")
+
+    def fetch_keepalive_thread(self):
+        """
+        Connects the pool at startup, then re-connects dropped connections whenever the session
+        was idle for HTTP_KEEPALIVE_INTERVAL, so no TLS handshake lands on a booking
+        """
+        self.prewarm()
+        while not self._thread_stop_f:
+            time.sleep(HTTP_KEEPALIVE_INTERVAL / 2)
+            if time.monotonic() - self._last_activity >= HTTP_KEEPALIVE_INTERVAL:
+                self.prewarm()
+                self._last_activity = time.monotonic()
+
     def response_hook(self, res, *args, **kwargs):
+        self._last_activity = time.monotonic()
+        retries = getattr(res.raw, 'retries', None)
+        for attempt in (retries.history if retries else ()):
+            if attempt.status:
+                self.scheduler.record(res.request.url, attempt.status)
+        self.scheduler.record(res.request.url, res.status_code, res.elapsed.total_seconds())
+        observe('request', res.elapsed.total_seconds(), endpoint=endpoint_key(res.request.url))
+        if self.capture:
+            self.capture.record(res)
         if not res.request.url.startswith((self.storage_url, *self.api.values()),):
             if res.status_code == 401:
                 if res.request.headers.get('REATTEMPT'):
                     res.raise_for_status()
-                self.get_access_token()
+                sent = res.request.headers.get('Authorization')
+                if sent:
+                    self.refresh_access_token(rejected=sent[len('Bearer '):])
+                else:
+                    self.get_access_token()
                 req = res.request
                 req.headers['REATTEMPT'] = 1
                 req = self.auth(req)
@@ -0,0 +1,156 @@
+"""
+Module defines the live polling dashboard.
+
+Every section (locations, option table, status) is cached and only rebuilt when its values
+change, option rows keep their rendered cells until the option changes; the rich Live region
+is refreshed only when something changed and at most DASHBOARD_FPS times a second.
+In headless mode nothing is drawn, changes are logged as plain compact lines instead.
+"""
+import re
+import time
+import threading
+
+from rich.live import Live
+from rich.table import Table
+from rich.text import Text
+from rich.console import Console, Group
+
+from .logger import log
+from .config import (
+    DASHBOARD_ENABLED,
+    DASHBOARD_FPS,
+)
+
+COLUMNS = ("center", "district", "pincode", "available", "date", "slots")
+
+
+class LiveDashboard(object):
+
+    def __init__(self, enabled=DASHBOARD_ENABLED, fps=DASHBOARD_FPS, console=None):
+        self.enabled = enabled
+        self.frame_interval = 1 / fps
+        self.console = console or Console()
+        self._rows = {}         # (group, session id) -> (row values, rendered cells)
+        self._locations = {}    # (group, location) -> status text
+        self._status = ""
+        self._logged_status = None
+        self._sections = {}     # section name -> rendered section
+        self._dirty = set()     # sections to rebuild
+        self._lock = threading.Lock()
+        self._live = None
+        self._thread = None
+
+    def start(self):
+        if not self.enabled or self._live is not None:
+            return
+        self._live = Live(console=self.console, auto_refresh=False, redirect_stdout=True, redirect_stderr=True)
+        self._live.start()
+        self._thread = threading.Thread(target=self._run, name='DashboardThread', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._live is not None:
+            self._live.stop()
+            self._live = None
+
+    def update_options(self, options, group=None):
+        """
+        This function replaces the option rows of `group`, re-rendering only rows whose values changed
+        """
+        with self._lock:
+            changed = False
+            current = {(group, option.session_id) for option in options}
+            for key in [key for key in self._rows if key[0] == group and key not in current]:
+                del self._rows[key]
+                changed = True
+            for option in options:
+                key = (group, option.session_id)
+                values = (
+                    option.name, option.district, str(option.pincode),
+                    str(option.available), option.date, ", ".join(option.slots),
+                )
+                if key not in self._rows or self._rows[key][0] != values:
+                    self._rows[key] = (values, [Text(value) for value in values])
+                    changed = True
+            if not changed:
+                return
+            self._dirty.add('table')
+        if not self.enabled:
+            best = f", best: {options[0].name} on {options[0].date} ({options[0].available} available)" if options else ""
+            prefix = f"{group}: " if group is not None else ""
+            log.info(f"{prefix}{len(options)} viable option(s){best}")
+
+    def update_location(self, location, text, group=None):
+        with self._lock:
+            if self._locations.get((group, location)) == text:
+                return
+            self._locations[(group, location)] = text
+            self._dirty.add('locations')
+        if not self.enabled:
+            log.info(f"{group}: {text}" if group is not None else text)
+
+    def set_status(self, text):
+        with self._lock:
+            if self._status == text:
+                return
+            self._status = text
+            self._dirty.add('status')
+            # headless, a countdown is logged once, not every second
+            kind = re.sub(r"\d+", "#", text)
+            if self.enabled or kind == self._logged_status:
+                return
+            self._logged_status = kind
+        log.info(" | ".join(line for line in text.splitlines() if line))
+
+    def _render_table(self):
+        table = Table(expand=False)
+        groups = {group for group, _ in self._rows}
+        if len(groups) > 1:
+            table.add_column("account")
+        for column in COLUMNS:
+            table.add_column(column)
+        for (group, _), (_, cells) in self._rows.items():
+            table.add_row(*((str(group),) if len(groups) > 1 else ()), *cells)
+        return table
+
+    def _render_locations(self):
+        return Text("\n".join(
+            f"{group}: {text}" if group is not None else text
+            for (group, _), text in self._locations.items()
+        ))
+
+    def _render_status(self):
+        return Text(self._status, style="bold")
+
+    def _render(self):
+        for section in self._dirty:
+            self._sections[section] = getattr(self, f'_render_{section}')()
+        self._dirty = set()
+        return Group(*(self._sections.get(section, Text("")) for section in ('locations', 'table', 'status')))
+
+    def _run(self):
+        while self._live is not None:
+            with self._lock:
+                renderable = self._render() if self._dirty else None
+            if renderable is not None and self._live is not None:
+                self._live.update(renderable, refresh=True)
+            time.sleep(self.frame_interval)
+
+
+_dashboard = None
+_dashboard_lock = threading.Lock()
+
+
+def get_dashboard():
+    """
+    This function returns the process wide dashboard (rich allows one live region per console)
+    """
+    global _dashboard
+    with _dashboard_lock:
+        if _dashboard is None:
+            _dashboard = LiveDashboard()
+        return _dashboard
+
+
+def set_headless(headless=True):
+    get_dashboard().enabled = not headless
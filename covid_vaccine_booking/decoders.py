@@ -0,0 +1,186 @@
+"""
+Module defines pluggable decoders for calendar responses.
+
+Full decoders turn the whole body into python objects. The streaming path reads
+`centers[*].sessions[*]` incrementally (needs the optional `ijson` package) and only
+builds the sessions that pass the caller's checks.
+"""
+import sys
+import json
+import time
+import tracemalloc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from .metrics import span
+from .config import (
+    CALENDAR_DECODER,
+)
+
+DECODERS = {
+    'json': json.loads,
+}
+if orjson is not None:
+    DECODERS['orjson'] = orjson.loads
+
+
+def get_decoder(name=CALENDAR_DECODER):
+    """
+    This function returns the full decoder registered as `name`, the fastest available one for 'auto'
+    """
+    if name in (None, 'auto', 'stream'):
+        return DECODERS.get('orjson', json.loads)
+    return DECODERS[name]
+
+
+def register_decoder(name, loads):
+    DECODERS[name] = loads
+
+
+def streaming_available():
+    return ijson is not None
+
+
+class CalendarSessionFilter(object):
+    """
+    Checks applied while streaming a calendar.
+
+    center(center) is called once per center with its scalar fields, session(session) once per session;
+    only sessions passing both are kept.
+    """
+
+    def __init__(self, center, session):
+        self.center = center
+        self.session = session
+
+
+_CENTER = 'centers.item'
+_SESSION = 'centers.item.sessions.item'
+_CENTER_FIELD = _CENTER + '.'
+
+
+def iter_sessions_streaming(body, checks):
+    """
+    This function
+        1. Parses the calendar body incrementally with ijson,
+        2. Keeps only scalar center fields and builds each session object on its own,
+        3. Drops sessions failing checks.session as soon as they are complete, and
+        4. Yields (number of centers passing checks.center, [(center, session), ...]) per center
+    """
+    center = None
+    matched = []
+    builder = None
+    for prefix, event, value in ijson.parse(body, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == _SESSION and event == 'end_map':
+                session = builder.value
+                builder = None
+                if checks.session(session):
+                    matched.append(session)
+            continue
+
+        if prefix == _SESSION and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif prefix == _CENTER and event == 'start_map':
+            center, matched = {}, []
+        elif prefix == _CENTER and event == 'end_map':
+            if checks.center(center):
+                yield 1, [(center, session) for session in matched]
+            center = None
+        elif center is not None and prefix.startswith(_CENTER_FIELD) and event in ('string', 'number', 'boolean', 'null'):
+            key = prefix[len(_CENTER_FIELD):]
+            if '.' not in key:
+                center[key] = value
+
+
+def iter_sessions_decoded(data, checks):
+    """
+    This function is the non streaming equivalent of iter_sessions_streaming over an already decoded calendar
+    """
+    for center in data.get("centers", []):
+        if checks.center(center):
+            yield 1, [(center, session) for session in center["sessions"] if checks.session(session)]
+
+
+def filter_calendar(body, checks, decoder=CALENDAR_DECODER, **labels):
+    """
+    This function returns (number of centers passing, [(center, session), ...]) from a raw calendar body,
+    streaming when `decoder` is 'stream', else decoding it fully first with the named (or fastest) decoder.
+
+    Streaming keeps peak memory lowest but is driven by python level ijson events, so it is slower
+    than a C decoder on typical bodies; run this module on a saved response to compare.
+    """
+    if decoder == 'stream' and streaming_available():
+        # parsing and filtering are interleaved, timed together as decode
+        stage = 'decode'
+        items = iter_sessions_streaming(body, checks)
+    else:
+        stage = 'filter'
+        with span('decode', **labels):
+            data = get_decoder(decoder)(body)
+        items = iter_sessions_decoded(data, checks)
+
+    center_count, sessions = 0, []
+    with span(stage, **labels):
+        for count, center_sessions in items:
+            center_count += count
+            sessions += center_sessions
+    return center_count, sessions
+
+
+def benchmark(body, checks, repeat=20):
+    """
+    This function times filter_calendar with every available decoder on the same body and
+    returns {decoder: (mean seconds per parse, peak bytes allocated)}
+    """
+    decoders = list(DECODERS)
+    if streaming_available():
+        decoders.append('stream')
+
+    results = {}
+    for name in decoders:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            filter_calendar(body, checks, decoder=name)
+        elapsed = (time.perf_counter() - started) / repeat
+
+        tracemalloc.start()
+        filter_calendar(body, checks, decoder=name)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (elapsed, peak)
+    return results
+
+
+if __name__ == "__main__":
+    # python -m covid_vaccine_booking.decoders calendar_response.json [min_slots]
+    # python -m covid_vaccine_booking.decoders cowin-capture.jsonl.gz [min_slots]
+    if sys.argv[1].endswith('.gz'):
+        from .capture import iter_bodies
+        bodies = [body for endpoint in ('calendarByDistrict', 'calendarByPin') for body in iter_bodies(sys.argv[1], endpoint)]
+    else:
+        with open(sys.argv[1], 'rb') as f:
+            bodies = [f.read()]
+    min_slots = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    checks = CalendarSessionFilter(
+        center=lambda center: True,
+        session=lambda session: session["available_capacity"] >= min_slots,
+    )
+    totals = {}
+    for body in bodies:
+        for name, (elapsed, peak) in benchmark(body, checks).items():
+            total_elapsed, max_peak = totals.get(name, (0, 0))
+            totals[name] = (total_elapsed + elapsed, max(max_peak, peak))
+    print(f"{len(bodies)} calendar response(s)")
+    for name, (elapsed, peak) in totals.items():
+        print(f"{name:>8}: {elapsed * 1000:8.2f} ms/parse  {peak / 1024:10.1f} KiB peak")
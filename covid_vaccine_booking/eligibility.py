@@ -0,0 +1,43 @@
+"""
+Module compiles the user's booking criteria into per session checks.
+"""
+from .decoders import CalendarSessionFilter
+
+
+def capacity_field(dose):
+    return 'available_capacity_dose2' if dose == 2 else 'available_capacity_dose1'
+
+
+def compile_criteria(min_age, max_age, fee_types, vaccine, minimum_slots, dose):
+    """
+    This function
+        1. Binds the criteria to local constants once,
+        2. Builds a center check (fee type) and a session check (dose capacity, age bracket, vaccine), and
+        3. Returns them as a CalendarSessionFilter, also callable as predicate(center, session)
+
+    Age is checked on every session against all beneficiaries, so centers mixing 18+ and 45+ sessions
+    are handled per session. Responses without dose wise capacity fall back to `available_capacity`.
+    """
+    fee_types = frozenset(fee_types)
+    vaccine = (vaccine or '').upper()
+    capacity_key = capacity_field(dose)
+
+    def center_check(center):
+        return center["fee_type"] in fee_types
+
+    def session_check(session):
+        max_age_limit = session.get("max_age_limit")
+        return (
+            session.get(capacity_key, session["available_capacity"]) >= minimum_slots
+            and session["min_age_limit"] <= min_age
+            and (max_age_limit is None or max_age <= max_age_limit)
+            and (not vaccine or session.get("vaccine", "").upper() == vaccine)
+        )
+
+    return SessionCriteria(center=center_check, session=session_check)
+
+
+class SessionCriteria(CalendarSessionFilter):
+
+    def __call__(self, center, session):
+        return self.center(center) and self.session(session)
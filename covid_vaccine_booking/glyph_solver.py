@@ -0,0 +1,289 @@
+"""
+Module defines an offline captcha solver working on the SVG glyph paths.
+
+CoWIN captchas draw every character as one filled <path> (noise lines are `fill="none"`).
+A glyph keeps its font outline across captchas up to translation and a little jitter, so
+each path is normalized to a signature (contour structure plus resampled outline) and
+looked up in an index learned from labelled captchas; characters are ordered by x.
+
+The packaged index is a stub: it only holds the four glyphs of tests/captcha.svg (S N u v)
+and cannot read real captchas, so the solver is off by default (CAPTCHA_LOCAL_SOLVER) and
+never takes part in the solver race until enabled. Captchas of successful bookings are learned
+into GLYPH_INDEX_FILE as the bot runs, and labelled captchas can be added with `learn` (which
+prints the characters known); enable CAPTCHA_LOCAL_SOLVER once they cover the captcha alphabet.
+
+    python -m covid_vaccine_booking.glyph_solver learn tests/captcha.svg SNNvu
+    python -m covid_vaccine_booking.glyph_solver solve captcha.svg
+"""
+import os
+import re
+import sys
+import json
+import math
+import threading
+from typing import NamedTuple, Tuple
+
+from .config import (
+    GLYPH_INDEX_FILE,
+    GLYPH_MATCH_THRESHOLD,
+)
+
+PACKAGED_INDEX_FILE = os.path.join(os.path.dirname(__file__), 'captcha_glyphs.json')
+
+PATH_ELEMENT = re.compile(r'<path\b([^>]*)>')
+PATH_ATTR = re.compile(r'([\w-]+)="([^"]*)"')
+PATH_COMMAND = re.compile(r'([MLQZmlqz])([^MLQZmlqz]*)')
+NUMBER = re.compile(r'-?\d*\.?\d+(?:[eE][-+]?\d+)?')
+
+RESAMPLE_POINTS = 16
+HEIGHT_WEIGHT = 0.5     # keeps 'v' and 'V', 'o' and 'O' apart, their outlines are alike
+
+
+class Glyph(NamedTuple):
+    x: float
+    height: float
+    structure: Tuple[int, ...]                  # anchor points per contour
+    descriptor: Tuple[Tuple[float, float], ...]  # contours resampled, normalized by height
+
+
+def glyph_paths(svg):
+    """
+    This function yields the `d` of every filled path, i.e. every glyph
+    """
+    for match in PATH_ELEMENT.finditer(svg):
+        attrs = dict(PATH_ATTR.findall(match.group(1)))
+        if attrs.get('fill', '') != 'none' and attrs.get('d'):
+            yield attrs['d']
+
+
+def parse_contours(d):
+    """
+    This function returns the anchor points (move-to and curve end points) of each contour;
+    the short line-to runs are jitter added around the anchors and are skipped
+    """
+    contours, current = [], []
+    for command, args in PATH_COMMAND.findall(d):
+        numbers = [float(n) for n in NUMBER.findall(args)]
+        command = command.upper()
+        if command == 'Z':
+            if current:
+                contours.append(current)
+            current = []
+        elif command == 'M':
+            if current:
+                contours.append(current)
+            current = [tuple(numbers[-2:])]
+        elif command == 'Q' and len(numbers) >= 4:
+            current.append(tuple(numbers[-2:]))
+    if current:
+        contours.append(current)
+    return contours
+
+
+def resample(points, n=RESAMPLE_POINTS):
+    """
+    This function resamples a polyline to n points evenly spaced along its length
+    """
+    if len(points) == 1:
+        return [points[0]] * n
+    lengths = [0.0]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        lengths.append(lengths[-1] + math.hypot(x1 - x0, y1 - y0))
+    total = lengths[-1] or 1.0
+    result, segment = [], 0
+    for i in range(n):
+        target = total * i / (n - 1)
+        while segment < len(points) - 2 and lengths[segment + 1] < target:
+            segment += 1
+        span = (lengths[segment + 1] - lengths[segment]) or 1.0
+        t = (target - lengths[segment]) / span
+        (x0, y0), (x1, y1) = points[segment], points[segment + 1]
+        result.append((x0 + (x1 - x0) * t, y0 + (y1 - y0) * t))
+    return result
+
+
+def glyph_from_path(d):
+    contours = [contour for contour in parse_contours(d) if contour]
+    points = [point for contour in contours for point in contour]
+    min_x = min(x for x, _ in points)
+    min_y = min(y for _, y in points)
+    height = (max(y for _, y in points) - min_y) or 1.0
+    descriptor = tuple(
+        (round((x - min_x) / height, 4), round((y - min_y) / height, 4))
+        for contour in contours
+        for x, y in resample(contour)
+    )
+    return Glyph(min_x, height, tuple(len(contour) for contour in contours), descriptor)
+
+
+def glyphs(svg):
+    """
+    This function returns the glyphs of a captcha ordered left to right
+    """
+    return sorted((glyph_from_path(d) for d in glyph_paths(svg)), key=lambda glyph: glyph.x)
+
+
+def distance(glyph, entry):
+    """
+    This function returns the mean distance between matching outline points, plus a height term
+    """
+    if len(glyph.descriptor) != len(entry['descriptor']):
+        return math.inf
+    outline = sum(
+        math.hypot(x - ex, y - ey) for (x, y), (ex, ey) in zip(glyph.descriptor, entry['descriptor'])
+    ) / len(glyph.descriptor)
+    return outline + HEIGHT_WEIGHT * abs(math.log(glyph.height / entry['height']))
+
+
+class GlyphIndex(object):
+    """
+    Glyph signatures by character; entries are grouped by number of contours so a lookup
+    only compares outlines of glyphs built the same way.
+    """
+
+    def __init__(self, entries=()):
+        self._by_structure = {}
+        self._lock = threading.Lock()
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._by_structure.values())
+
+    @property
+    def characters(self):
+        return sorted({entry['char'] for entries in self._by_structure.values() for entry in entries})
+
+    def add(self, entry):
+        with self._lock:
+            self._by_structure.setdefault(len(entry['descriptor']), []).append(entry)
+
+    def learn(self, svg, text):
+        """
+        This function adds the glyphs of a solved captcha, returns False when they do not line up with `text`
+        """
+        found = glyphs(svg)
+        if len(found) != len(text):
+            return False
+        for glyph, char in zip(found, text):
+            best, best_distance = self.match(glyph)
+            if best == char and best_distance < GLYPH_MATCH_THRESHOLD / 2:
+                continue    # already well covered
+            self.add({
+                'char': char,
+                'height': glyph.height,
+                'structure': list(glyph.structure),
+                'descriptor': [list(point) for point in glyph.descriptor],
+            })
+        return True
+
+    def match(self, glyph):
+        """
+        This function returns (character, distance) of the closest known glyph, (None, inf) if there is none
+        """
+        best, best_distance = None, math.inf
+        for entry in self._by_structure.get(len(glyph.descriptor), ()):
+            d = distance(glyph, entry)
+            if d < best_distance:
+                best, best_distance = entry['char'], d
+        return best, best_distance
+
+    def solve(self, svg, threshold=GLYPH_MATCH_THRESHOLD):
+        """
+        This function returns the captcha text, None unless every glyph matched within `threshold`
+        """
+        text = []
+        for glyph in glyphs(svg):
+            char, d = self.match(glyph)
+            if d > threshold:
+                return None
+            text.append(char)
+        return "".join(text) or None
+
+    def to_json(self):
+        with self._lock:
+            return [entry for entries in self._by_structure.values() for entry in entries]
+
+    def save(self, path=GLYPH_INDEX_FILE):
+        path = os.path.expanduser(path)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.to_json(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, *paths):
+        entries = []
+        for path in paths:
+            path = os.path.expanduser(path)
+            if os.path.exists(path):
+                with open(path) as f:
+                    entries.extend(json.load(f))
+        return cls(entries)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    This function returns the process wide index: packaged glyphs plus the ones learned locally
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = GlyphIndex.load(PACKAGED_INDEX_FILE, GLYPH_INDEX_FILE)
+        return _index
+
+
+def solve_glyphs(resp):
+    """
+    This function solves a getRecaptcha response offline, None when any glyph is unknown
+    """
+    return get_index().solve(resp['captcha'])
+
+
+def validate(corpus_dir, index=None):
+    """
+    This function solves every `<label>.svg` (or `<label>_<n>.svg`) of a labelled corpus and
+    returns (solved correctly, unsolved, wrong, total)
+    """
+    index = index or get_index()
+    correct = unsolved = wrong = total = 0
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith('.svg'):
+            continue
+        label = name[:-len('.svg')].split('_')[0]
+        with open(os.path.join(corpus_dir, name)) as f:
+            answer = index.solve(f.read())
+        total += 1
+        if answer is None:
+            unsolved += 1
+        elif answer == label:
+            correct += 1
+        else:
+            wrong += 1
+    return correct, unsolved, wrong, total
+
+
+if __name__ == "__main__":
+    # python -m covid_vaccine_booking.glyph_solver learn captcha.svg TEXT [index.json]
+    # python -m covid_vaccine_booking.glyph_solver solve captcha.svg
+    # python -m covid_vaccine_booking.glyph_solver validate corpus_dir
+    command, path = sys.argv[1], sys.argv[2]
+    if command == 'validate':
+        correct, unsolved, wrong, total = validate(path)
+        print(f"{correct}/{total} solved, {unsolved} unsolved, {wrong} wrong")
+        sys.exit(0)
+    with open(path) as f:
+        svg = f.read()
+    if command == 'learn':
+        target = sys.argv[4] if len(sys.argv) > 4 else GLYPH_INDEX_FILE
+        index = GlyphIndex.load(target)
+        if not index.learn(svg, sys.argv[3]):
+            sys.exit(f"{len(glyphs(svg))} glyphs found for {len(sys.argv[3])} characters")
+        index.save(target)
+        print(f"{len(index)} glyphs of {''.join(index.characters)} in {target}")
+    else:
+        print(get_index().solve(svg))
@@ -0,0 +1,114 @@
+"""
+Module defines an optional HTTP/2 transport for requests sessions.
+
+Calendar, captcha and booking requests to one host are multiplexed over a single TLS
+connection through httpx. Needs `pip install httpx[http2]`, otherwise the regular
+HTTP/1.1 adapter is used.
+"""
+import time
+from datetime import timedelta
+
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from .logger import log
+
+
+def http2_available():
+    return httpx is not None and h2 is not None
+
+
+class HTTP2Adapter(BaseAdapter):
+    """
+    requests adapter sending through an HTTP/2 httpx client, retrying on the statuses
+    of `max_retries` (a urllib3 Retry) and on transport errors the way TimeoutHTTPAdapter does.
+    Transport errors that are not retried are raised as the matching requests exception.
+    """
+
+    def __init__(self, timeout, max_retries, max_connections=10, keepalive_expiry=None):
+        super().__init__()
+        connect, read = timeout
+        self.max_retries = max_retries
+        self.client = httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=max_connections, keepalive_expiry=keepalive_expiry),
+        )
+
+    def _request(self, request, timeout=None):
+        kwargs = {}
+        if timeout is not None:
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            kwargs['timeout'] = httpx.Timeout(read, connect=connect)
+        return self.client.request(
+            request.method, request.url, headers=dict(request.headers), content=request.body, **kwargs,
+        )
+
+    @staticmethod
+    def to_requests_error(exc, request):
+        if isinstance(exc, httpx.ConnectTimeout):
+            return requests.ConnectTimeout(exc, request=request)
+        if isinstance(exc, httpx.ReadTimeout):
+            return requests.ReadTimeout(exc, request=request)
+        if isinstance(exc, httpx.TimeoutException):
+            return requests.Timeout(exc, request=request)
+        return requests.ConnectionError(exc, request=request)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        retry = self.max_retries
+        total = retry.total or 0
+        started = time.perf_counter()
+        for attempt in range(total + 1):
+            try:
+                resp = self._request(request, timeout)
+            except httpx.TransportError as exc:
+                # like urllib3, a request that may have reached the server is only resent when idempotent
+                sent = not isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout))
+                if attempt == total or (sent and not retry._is_method_retryable(request.method)):
+                    raise self.to_requests_error(exc, request) from exc
+                reason = exc
+            else:
+                if attempt == total or not retry.is_retry(request.method, resp.status_code):
+                    break
+                reason = resp.status_code
+            backoff = min(retry.backoff_factor * (2 ** attempt), retry.BACKOFF_MAX)
+            log.debug(f"Retrying {request.method} {request.url} after {reason!r} in {backoff}s")
+            time.sleep(backoff)
+        return self.build_response(request, resp, time.perf_counter() - started)
+
+    @staticmethod
+    def build_response(request, resp, elapsed):
+        response = Response()
+        response.status_code = resp.status_code
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response.headers.pop('Content-Encoding', None)     # httpx already decoded the body
+        response._content = resp.content
+        response.encoding = resp.encoding
+        response.reason = resp.reason_phrase
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=elapsed)
+        return response
+
+    def prewarm(self, url, count=1):
+        """
+        This function opens the (single, multiplexed) connection to the host of `url` with a HEAD request,
+        returns its status code
+        """
+        return self.client.request('HEAD', url).status_code
+
+    def close(self):
+        self.client.close()
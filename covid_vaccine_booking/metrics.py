@@ -0,0 +1,154 @@
+"""
+Module defines per stage latency instrumentation.
+
+Named spans feed log-linear (HDR style) histograms per stage and label set, exported as a
+Prometheus textfile and a JSON summary.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+from .config import (
+    METRICS_JSON_FILE,
+    METRICS_PROMETHEUS_FILE,
+    METRICS_EXPORT_INTERVAL,
+)
+
+
+class Histogram(object):
+    """
+    Log-linear histogram of microsecond values: exact below 2**SUB_BUCKET_BITS, above that each
+    power of two is split in 2**SUB_BUCKET_BITS buckets, so recorded values keep ~1% precision.
+    """
+
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def _bucket(self, value):
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS - 1)
+        return shift, value >> shift
+
+    def record(self, seconds):
+        value = max(1, int(seconds * 1_000_000))
+        bucket = self._bucket(value)
+        with self._lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        """
+        This function returns {quantile: seconds}, each value being the midpoint of its bucket
+        clamped to the recorded [min, max]
+        """
+        with self._lock:
+            buckets = sorted(self.counts.items(), key=lambda item: item[0][1] << item[0][0])
+            count, low, high = self.count, self.min, self.max
+        result = {}
+        for quantile in quantiles:
+            target, seen = quantile * count, 0
+            for (shift, index), bucket_count in buckets:
+                seen += bucket_count
+                if seen >= target:
+                    midpoint = (index << shift) + ((1 << shift) >> 1)
+                    result[quantile] = min(max(midpoint, low), high) / 1_000_000
+                    break
+        return result
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.total / 1_000_000,
+            'min': (self.min or 0) / 1_000_000,
+            'max': (self.max or 0) / 1_000_000,
+            **{f'p{int(q * 100)}': v for q, v in self.percentiles().items()},
+        }
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._last_export = 0
+
+    def histogram(self, stage, **labels):
+        key = (stage, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            return self._histograms[key]
+
+    def observe(self, stage, seconds, **labels):
+        self.histogram(stage, **labels).record(seconds)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, **labels)
+
+    def items(self):
+        with self._lock:
+            return list(self._histograms.items())
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP cowin_stage_seconds Latency of booking pipeline stages.",
+            "# TYPE cowin_stage_seconds summary",
+        ]
+        for (stage, labels), histogram in self.items():
+            label_str = ",".join([f'stage="{stage}"'] + [f'{k}="{v}"' for k, v in labels])
+            for quantile, value in histogram.percentiles().items():
+                lines.append(f'cowin_stage_seconds{{{label_str},quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'cowin_stage_seconds_sum{{{label_str}}} {histogram.total / 1_000_000:.6f}')
+            lines.append(f'cowin_stage_seconds_count{{{label_str}}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return [
+            {'stage': stage, 'labels': dict(labels), **histogram.summary()}
+            for (stage, labels), histogram in self.items()
+        ]
+
+    @staticmethod
+    def _write_atomic(path, text):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def export(self, prometheus_file=METRICS_PROMETHEUS_FILE, json_file=METRICS_JSON_FILE):
+        if prometheus_file:
+            self._write_atomic(prometheus_file, self.to_prometheus())
+        if json_file:
+            self._write_atomic(json_file, json.dumps(self.to_json(), indent=2))
+
+    def maybe_export(self):
+        """
+        This function refreshes the Prometheus textfile at most every METRICS_EXPORT_INTERVAL seconds
+        """
+        now = time.monotonic()
+        if METRICS_PROMETHEUS_FILE and now - self._last_export >= METRICS_EXPORT_INTERVAL:
+            self._last_export = now
+            self.export(json_file=None)
+
+
+metrics = Metrics()
+span = metrics.span
+observe = metrics.observe
+atexit.register(metrics.export)
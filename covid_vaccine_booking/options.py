@@ -0,0 +1,32 @@
+import sys
+from typing import NamedTuple
+
+
+class SlotOption(NamedTuple):
+    """
+    One bookable session.
+
+    Tuple backed (no per option dict), center and district strings are interned and
+    `slots` references the list from the decoded calendar instead of copying it.
+    """
+    name: str
+    district: str
+    pincode: int
+    center_id: int
+    available: int
+    date: str
+    slots: list
+    session_id: str
+
+    @classmethod
+    def from_session(cls, center, session):
+        return cls(
+            sys.intern(center["name"]),
+            sys.intern(center["district_name"]),
+            center["pincode"],
+            center["center_id"],
+            session["available_capacity"],
+            session["date"],
+            session["slots"],
+            session["session_id"],
+        )
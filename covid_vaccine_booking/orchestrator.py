@@ -0,0 +1,173 @@
+import time
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .booking_client import BookingClient
+from .captcha import get_captcha_window
+from .decoders import get_decoder
+from .metrics import metrics
+
+
+class BookingOrchestrator(object):
+    """
+    Books for many mobiles from one process.
+
+    Calendar queries of all accounts are merged into unique poll targets, each target is fetched
+    and decoded once per cycle and the result is fanned out to every interested account's filter
+    and booking path, so request volume grows with unique locations rather than with accounts.
+    Accounts with options book at the same time, each on its own worker.
+    """
+
+    def __init__(self, mobiles):
+        self.accounts = []
+        for mobile in mobiles:
+            print(f"\n================================= Account {mobile} =================================\n")
+            account = BookingClient(mobile)
+            account.exit_on_booking = False
+            self.accounts.append(account)
+        self._calendars = {}    # target key -> (digest, decoded calendar, {account: options}, conditional headers)
+        self.booking_executor = ThreadPoolExecutor(max_workers=len(self.accounts), thread_name_prefix='BookingThread')
+
+    @property
+    def active_accounts(self):
+        return [account for account in self.accounts if not account.booked]
+
+    def next_cycle_delay(self):
+        """
+        This function returns seconds to wait before the next cycle: the shortest refresh frequency of the accounts,
+        or longer when the rate limit budget needs time to refill for all poll targets
+        """
+        poller = self.active_accounts[0]
+        targets = self.poll_targets()
+        apis = Counter(api for api, _, _ in targets.values())
+        budget_delay = max(
+            [poller.client.session.scheduler.delay(poller.client.api[api], count) for api, count in apis.items()],
+            default=0,
+        )
+        refresh_freq = min(account.info.refresh_freq for account in self.active_accounts)
+        return max(refresh_freq, budget_delay)
+
+    def poll_targets(self):
+        """
+        This function returns dict of target key -> (api, params, list of interested (account, location))
+        """
+        targets = {}
+        for account in self.active_accounts:
+            api, params_ls = account.calendar_query()
+            for location, params in params_ls:
+                key = (api, BookingClient.calendar_key(params))
+                targets.setdefault(key, (api, params, []))[2].append((account, location))
+        return targets
+
+    def conditional_headers(self, key):
+        """
+        This function returns the If-None-Match/If-Modified-Since headers of the calendar kept for the target;
+        the poller's own ones may belong to a body this orchestrator has not seen
+        """
+        previous = self._calendars.get(key)
+        return previous[3] if previous else {}
+
+    def fetch_targets(self, targets):
+        """
+        This function fetches every target once, concurrently, and returns dict of target key -> response
+        """
+        poller = self.active_accounts[0]
+        responses = {}
+        for api in {api for api, _, _ in targets.values()}:
+            params_ls = [(key, params) for key, (target_api, params, _) in targets.items() if target_api == api]
+            fetch = getattr(poller.client, f'get_{api}')
+            conditional_headers = lambda params: self.conditional_headers((api, BookingClient.calendar_key(params)))
+            for key, _, resp in poller.fetch_calendars(fetch, params_ls, conditional_headers):
+                responses[key] = resp
+        return responses
+
+    def target_calendar(self, key, resp):
+        """
+        This function returns the (digest, decoded calendar, per account options) for the target,
+        decoding the response only when its body changed since the previous cycle (a 304 is unchanged)
+        """
+        previous = self._calendars.get(key)
+        if resp is not None and resp.status_code == 304:
+            return previous
+        if resp is None or resp.status_code != 200:
+            return None
+        digest = hashlib.blake2b(resp.content, digest_size=16).digest()
+        if previous and previous[0] == digest:
+            return previous
+        headers = {}
+        if resp.headers.get('ETag'):
+            headers['If-None-Match'] = resp.headers['ETag']
+        if resp.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = resp.headers['Last-Modified']
+        self._calendars[key] = (digest, get_decoder()(resp.content), {}, headers)
+        return self._calendars[key]
+
+    def check_and_book(self):
+        """
+        This function
+            1. Checks the calendar once for every unique location of all accounts,
+            2. Lists viable options of each account,
+            3. Books for accounts having viable options, and
+            4. Returns True if any booking was attempted
+        """
+        self.accounts[0].dashboard.start()
+        for account in self.active_accounts:
+            account.captcha_pool
+        targets = self.poll_targets()
+        responses = self.fetch_targets(targets)
+
+        calendars = {account: [] for account in self.active_accounts}
+        for key, (api, params, interested) in targets.items():
+            target = self.target_calendar(key, responses.get(key))
+            for account, location in interested:
+                if target is None:
+                    calendars[account].append((location, None))
+                    continue
+                _, data, account_options, _ = target
+                if account not in account_options:
+                    account_options[account] = account.options_from_calendar(data)
+                calendars[account].append((location, account_options[account]))
+        self._calendars = {key: value for key, value in self._calendars.items() if key in targets}
+        metrics.maybe_export()
+
+        bookings = []
+        for account, account_calendars in calendars.items():
+            options = account.rank_options(account.report_options(account_calendars))
+            new_req = account.build_booking_request(options)
+            if new_req is not None:
+                print(f"Booking with info: {new_req}")
+                bookings.append(self.booking_executor.submit(account.attempt_booking, options, new_req))
+        self.wait_for_bookings(bookings)
+        return bool(bookings)
+
+    def wait_for_bookings(self, bookings):
+        """
+        This function waits for the bookings dispatched this cycle, driving the captcha window
+        meanwhile since it only works from the main thread
+        """
+        window = get_captcha_window()
+        manual = any(not account.info.captcha_automation for account in self.active_accounts)
+        while bookings:
+            if manual and window.on_gui_thread():
+                window.pump(0.05)
+                done = [booking for booking in bookings if booking.done()]
+            else:
+                done, _ = wait(bookings, timeout=0.05)
+            for booking in done:
+                bookings.remove(booking)
+                if booking.exception():
+                    print(f"Booking failed: {booking.exception()}")
+
+    def run(self):
+        while self.active_accounts:
+            try:
+                if not self.check_and_book() and self.active_accounts:
+                    self.active_accounts[0].wait_for_next_cycle(self.next_cycle_delay())
+
+            except Exception as e:
+                print(str(e))
+                print('Retryin in 5 seconds')
+                time.sleep(5)
+
+        print("Booked for all accounts.")
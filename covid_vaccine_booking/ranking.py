@@ -0,0 +1,69 @@
+"""
+Module ranks viable options so booking goes to the most likely winners first.
+"""
+import heapq
+from datetime import datetime
+from functools import lru_cache
+
+from .config import (
+    RANKING,
+    RANK_TOP_K,
+)
+
+
+@lru_cache(maxsize=128)
+def date_ordinal(date):
+    """
+    This function parses a dd-mm-yyyy calendar date once per distinct value
+    """
+    return datetime.strptime(date, "%d-%m-%Y").toordinal()
+
+
+def earliest_date(ranker, option):
+    return date_ordinal(option.date)
+
+
+def highest_capacity(ranker, option):
+    return -option.available
+
+
+def preferred(ranker, option):
+    return 0 if (option.pincode in ranker.preferred_pincodes or option.center_id in ranker.preferred_centers) else 1
+
+
+def nearest(ranker, option):
+    # pincodes are assigned geographically, numeric distance is a cheap proxy for travel distance
+    return abs(option.pincode - ranker.home_pincode) if ranker.home_pincode else 0
+
+
+SCORERS = {
+    'preferred': preferred,
+    'earliest_date': earliest_date,
+    'nearest': nearest,
+    'highest_capacity': highest_capacity,
+}
+
+
+def register_scorer(name, scorer):
+    SCORERS[name] = scorer
+
+
+class OptionRanker(object):
+    """
+    Ranks options by a tuple of scores (lower is better), compared in the order of `ranking`.
+    """
+
+    def __init__(self, ranking=RANKING, preferred_pincodes=(), preferred_centers=(), home_pincode=None):
+        self.scorers = [SCORERS[name] for name in ranking]
+        self.preferred_pincodes = frozenset(int(pincode) for pincode in preferred_pincodes)
+        self.preferred_centers = frozenset(int(center) for center in preferred_centers)
+        self.home_pincode = int(home_pincode) if home_pincode else None
+
+    def score(self, option):
+        return tuple(scorer(self, option) for scorer in self.scorers)
+
+    def top(self, options, k=RANK_TOP_K):
+        """
+        This function returns the best k options, best first, keeping only k candidates in a heap
+        """
+        return heapq.nsmallest(k, options, key=self.score)
@@ -0,0 +1,132 @@
+"""
+Module defines in-process TTL/LRU cache for api responses.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class _Load(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.loaded = False
+        self.value = None
+
+
+class TTLCache(object):
+    """
+    Thread safe cache with per entry TTL and LRU eviction, bounded by entry count and/or total bytes.
+
+    Concurrent misses for the same key are coalesced: only one caller runs the loader,
+    the others wait for its result. With a ttl of 0 nothing is kept, only concurrent loads
+    are coalesced.
+    """
+
+    def __init__(self, ttl, max_entries=None, max_bytes=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (expires, size, value)
+        self._loading = {}              # key -> _Load in progress
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _pop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._pop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value, size=0):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            if self.ttl <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.total_bytes += size
+            while (
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+                or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+            ):
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, cacheable=lambda value: True, sizeof=lambda value: 0):
+        """
+        This function
+            1. Returns the cached value for key, if fresh,
+            2. Otherwise returns the result of a concurrent load of the same key, if any, or
+            3. Calls loader() and caches its result when cacheable(result)
+        """
+        while True:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry[2]
+                load = self._loading.get(key)
+                if load is None:
+                    self.misses += 1
+                    load = self._loading[key] = _Load()
+                    break
+            load.event.wait()
+            if load.loaded:
+                with self._lock:
+                    self.coalesced += 1
+                return load.value
+            # the loader raised, try again
+
+        try:
+            value = loader()
+            if cacheable(value):
+                self.put(key, value, size=sizeof(value))
+            load.value, load.loaded = value, True
+            return value
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            load.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'coalesced': self.coalesced,
+        }
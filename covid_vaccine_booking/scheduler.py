@@ -0,0 +1,171 @@
+"""
+Module defines rate limit aware polling scheduler.
+"""
+import time
+import threading
+from urllib.parse import urlsplit
+
+from .config import (
+    RATE_LIMIT_CALLS,
+    RATE_LIMIT_PERIOD,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MAX_FACTOR,
+    RATE_LIMIT_MIN_FACTOR,
+)
+
+
+def endpoint_key(url):
+    return urlsplit(url).path
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket refilled at `rate` tokens/second up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    @property
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+    def drain(self):
+        with self._lock:
+            self._refill()
+            self.tokens = 0
+
+    def try_acquire(self, count=1):
+        with self._lock:
+            self._refill()
+            if self.tokens >= count:
+                self.tokens -= count
+                return True
+            return False
+
+    def time_until(self, count=1):
+        with self._lock:
+            self._refill()
+            missing = min(count, self.capacity) - self.tokens
+            return max(0.0, missing / self.rate)
+
+
+class EndpointBudget(object):
+    """
+    Request budget of one endpoint, adapted AIMD style:
+    the rate is halved on every 429 and raised by a small step after a run of fast successes.
+    """
+
+    DECREASE_FACTOR = 0.5
+    INCREASE_STEP = 0.05    # fraction of the base rate added per recovery step
+    RECOVERY_AFTER = 10     # successes without throttling before a recovery step
+    LATENCY_TARGET = 2.0    # seconds; slower responses pause recovery
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, name, base_rate, burst, min_rate, max_rate):
+        self.name = name
+        self.base_rate = base_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.bucket = TokenBucket(rate=base_rate, capacity=burst)
+        self.latency = None
+        self.requests = 0
+        self.throttled = 0
+        self._streak = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def record(self, status_code, elapsed=None):
+        with self._lock:
+            self.requests += 1
+            if status_code == 429:
+                self.throttled += 1
+                self._streak = 0
+                self.bucket.rate = max(self.min_rate, self.bucket.rate * self.DECREASE_FACTOR)
+                self.bucket.drain()
+                return
+
+            if elapsed is not None:
+                self.latency = elapsed if self.latency is None else (
+                    self.EWMA_ALPHA * elapsed + (1 - self.EWMA_ALPHA) * self.latency
+                )
+            self._streak += 1
+            if self._streak >= self.RECOVERY_AFTER and (self.latency or 0) < self.LATENCY_TARGET:
+                self._streak = 0
+                self.bucket.rate = min(self.max_rate, self.bucket.rate + self.base_rate * self.INCREASE_STEP)
+
+    def summary(self):
+        latency = f"{self.latency * 1000:.0f}ms" if self.latency is not None else "-"
+        return (
+            f"{self.name}: {self.bucket.available:.1f}/{self.bucket.capacity} tokens, "
+            f"{self.rate * 60:.1f} req/min, {self.throttled}/{self.requests} throttled, latency {latency}"
+        )
+
+
+class BudgetExhausted(Exception):
+    """
+    Raised instead of sending a request the endpoint budget has no token left for.
+    """
+
+
+class AdaptiveScheduler(object):
+    """
+    Per endpoint token buckets shared by all sessions of the process (they share the client IP).
+    """
+
+    def __init__(self, calls=RATE_LIMIT_CALLS, period=RATE_LIMIT_PERIOD, burst=RATE_LIMIT_BURST):
+        self.base_rate = calls / period
+        self.burst = burst
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def budget(self, url):
+        name = endpoint_key(url)
+        with self._lock:
+            if name not in self._budgets:
+                self._budgets[name] = EndpointBudget(
+                    name=name,
+                    base_rate=self.base_rate,
+                    burst=self.burst,
+                    min_rate=self.base_rate * RATE_LIMIT_MIN_FACTOR,
+                    max_rate=self.base_rate * RATE_LIMIT_MAX_FACTOR,
+                )
+            return self._budgets[name]
+
+    def try_acquire(self, url, count=1):
+        return self.budget(url).bucket.try_acquire(count)
+
+    def charge(self, url, count=1):
+        """
+        This function takes count tokens for a request about to go to the network, or raises BudgetExhausted
+        """
+        if not self.try_acquire(url, count):
+            raise BudgetExhausted(f"Rate limit budget exhausted for {endpoint_key(url)}")
+
+    def record(self, url, status_code, elapsed=None):
+        self.budget(url).record(status_code, elapsed)
+
+    def delay(self, url, count=1):
+        """
+        This function returns seconds to wait until `count` requests to url fit in the budget
+        """
+        return self.budget(url).bucket.time_until(count)
+
+    def summary(self):
+        with self._lock:
+            budgets = list(self._budgets.values())
+        return " | ".join(budget.summary() for budget in budgets)
@@ -0,0 +1,267 @@
+"""
+Module defines a local stand-in for the CoWIN api, used to tune and benchmark the booking
+pipeline without touching the real service.
+
+Implements the endpoints of CoWinClient.api and CoWinSession.api plus the kvdb OTP bucket,
+with configurable latency, 401/429/5xx injection and scripted slot releases.
+
+    python -m covid_vaccine_booking.standin_server --port 8000 --latency 50 --script releases.json
+
+then run the client with COWIN_BASE_URL=http://127.0.0.1:8000/api/v2/ and
+COWIN_STORAGE_URL_BASE=http://127.0.0.1:8000/kvdb/
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+API_PREFIX = '/api/v2/'
+STORAGE_PREFIX = '/kvdb/'
+STANDIN_OTP = '123456'
+STANDIN_TOKEN = 'standin-token'
+STANDIN_CAPTCHA = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="150" height="50" viewBox="0,0,150,50">'
+    '<text x="20" y="35" font-size="30">STAND</text></svg>'
+)
+
+
+class StandInState(object):
+    """
+    Sessions, fault injection settings and booking records of the stand-in.
+
+    A release is a dict with `at` (seconds after start), `district_id`, `pincode`,
+    `capacity` and optional `date`, `center_id`, `name`, `fee_type`, `min_age_limit`, `vaccine`.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rates=None, script=()):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rates = dict(error_rates or {})   # {401: 0.01, 429: 0.05, 503: 0.01}
+        self.sessions = {}
+        self.bookings = []
+        self.started = time.time()
+        self._lock = threading.Lock()
+        for release in script:
+            self.schedule(release)
+
+    def schedule(self, release):
+        delay = max(0, self.started + release.get('at', 0) - time.time())
+        timer = threading.Timer(delay, self.release, kwargs={k: v for k, v in release.items() if k != 'at'})
+        timer.daemon = True
+        timer.start()
+
+    def release(self, district_id=1, pincode=110001, capacity=10, date=None, center_id=None,
+                name=None, fee_type='Free', min_age_limit=18, vaccine='COVISHIELD', district_name='Stand-in'):
+        """
+        This function publishes a session immediately and returns its session id
+        """
+        session_id = str(uuid.uuid4())
+        center_id = center_id or random.randint(100000, 999999)
+        session_date = date or (date_today() + timedelta(days=1)).strftime("%d-%m-%Y")
+        with self._lock:
+            self.sessions[session_id] = {
+                'published_at': time.time(),
+                'center': {
+                    'center_id': center_id,
+                    'name': name or f"Stand-in Center {center_id}",
+                    'district_name': district_name,
+                    'district_id': int(district_id),
+                    'pincode': int(pincode),
+                    'fee_type': fee_type,
+                },
+                'session': {
+                    'session_id': session_id,
+                    'date': session_date,
+                    'available_capacity': capacity,
+                    'available_capacity_dose1': capacity,
+                    'available_capacity_dose2': capacity,
+                    'min_age_limit': min_age_limit,
+                    'vaccine': vaccine,
+                    'slots': ["09:00AM-11:00AM", "11:00AM-01:00PM", "01:00PM-03:00PM", "03:00PM-05:00PM"],
+                },
+            }
+        return session_id
+
+    def calendar(self, district_id=None, pincode=None):
+        centers = {}
+        with self._lock:
+            for item in self.sessions.values():
+                center = item['center']
+                if district_id is not None and center['district_id'] != int(district_id):
+                    continue
+                if pincode is not None and center['pincode'] != int(pincode):
+                    continue
+                entry = centers.setdefault(center['center_id'], dict(center, sessions=[]))
+                entry['sessions'].append(dict(item['session']))
+        return {'centers': list(centers.values())}
+
+    def book(self, payload):
+        with self._lock:
+            item = self.sessions.get(payload.get('session_id'))
+            if item is None:
+                return 400, {'error': 'Session not found'}
+            session = item['session']
+            seats = len(payload.get('beneficiaries', [])) or 1
+            if session['available_capacity'] < seats:
+                return 409, {'errorCode': 'APPOIN0040', 'error': 'This vaccination center is completely booked for the selected date'}
+            for key in ('available_capacity', 'available_capacity_dose1', 'available_capacity_dose2'):
+                session[key] -= seats
+            booked_at = time.time()
+            self.bookings.append({
+                'session_id': session['session_id'],
+                'published_at': item['published_at'],
+                'booked_at': booked_at,
+                'latency': booked_at - item['published_at'],
+            })
+        return 200, {'appointment_confirmation_no': str(uuid.uuid4())}
+
+    def injected_status(self):
+        for status, rate in self.error_rates.items():
+            if random.random() < rate:
+                return int(status)
+        return None
+
+
+def date_today():
+    return date.today()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    PUBLIC = ('auth/generateMobileOTP', 'auth/validateMobileOtp', 'auth/public/generateOTP')
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return {}
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        payload = self._read_json() if method in ('POST', 'PUT') else {}
+
+        if self.state.latency or self.state.jitter:
+            time.sleep(max(0, self.state.latency + random.uniform(-self.state.jitter, self.state.jitter)))
+
+        if url.path.startswith(STORAGE_PREFIX):
+            if method == 'PUT':
+                return self._send(200, '', 'text/plain')
+            return self._send(200, f"Your OTP to register/access CoWIN is {STANDIN_OTP}. It will be valid for 3 minutes. - CoWIN", 'text/plain')
+
+        if not url.path.startswith(API_PREFIX):
+            return self._send(404, {'error': 'Not found'})
+        path = url.path[len(API_PREFIX):]
+
+        injected = self.state.injected_status()
+        if injected:
+            return self._send(injected, {'error': 'Injected fault'})
+        if path not in self.PUBLIC and self.headers.get('Authorization') != f"Bearer {STANDIN_TOKEN}":
+            return self._send(401, {'error': 'Unauthenticated access!'})
+
+        if path in ('auth/generateMobileOTP', 'auth/public/generateOTP'):
+            return self._send(200, {'txnId': str(uuid.uuid4())})
+        if path == 'auth/validateMobileOtp':
+            return self._send(200, {'token': STANDIN_TOKEN})
+        if path == 'auth/getRecaptcha':
+            return self._send(200, {'captcha': STANDIN_CAPTCHA})
+        if path == 'appointment/beneficiaries':
+            return self._send(200, {'beneficiaries': [{
+                'beneficiary_reference_id': '12345678901234',
+                'name': 'Stand-in Beneficiary',
+                'vaccine': '',
+                'birth_year': '1990',
+                'vaccination_status': 'Not Vaccinated',
+            }]})
+        if path == 'admin/location/states':
+            return self._send(200, {'states': [{'state_id': 1, 'state_name': 'Stand-in State'}]})
+        if path.startswith('admin/location/districts/'):
+            return self._send(200, {'districts': [{'district_id': 1, 'district_name': 'Stand-in'}]})
+        if path == 'appointment/sessions/calendarByDistrict':
+            return self._send(200, self.state.calendar(district_id=query.get('district_id')))
+        if path == 'appointment/sessions/calendarByPin':
+            return self._send(200, self.state.calendar(pincode=query.get('pincode')))
+        if path == 'appointment/schedule' and method == 'POST':
+            return self._send(*self.state.book(payload))
+        return self._send(404, {'error': 'Not found'})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_HEAD(self):
+        self._handle('HEAD')
+
+
+def serve(state, host='127.0.0.1', port=0):
+    """
+    This function starts the stand-in in a daemon thread and returns (server, base_url, storage_url_base)
+    """
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, name='StandInServer', daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}{API_PREFIX}", f"http://{host}:{port}{STORAGE_PREFIX}"
+
+
+def parse_error_rates(values):
+    return {int(status): float(rate) for status, rate in (value.split('=') for value in values)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local CoWIN stand-in server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, help='added latency per request, ms')
+    parser.add_argument('--jitter', type=float, default=0, help='latency jitter, ms')
+    parser.add_argument('--error', action='append', default=[], metavar='STATUS=RATE', help='e.g. --error 429=0.05')
+    parser.add_argument('--script', help='json file with a list of slot releases')
+    args = parser.parse_args()
+
+    script = []
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    state = StandInState(
+        latency=args.latency / 1000, jitter=args.jitter / 1000,
+        error_rates=parse_error_rates(args.error), script=script,
+    )
+    server, base_url, storage_url = serve(state, args.host, args.port)
+    print(f"COWIN_BASE_URL={base_url}\nCOWIN_STORAGE_URL_BASE={storage_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
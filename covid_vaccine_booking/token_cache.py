@@ -0,0 +1,114 @@
+"""
+Module defines an encrypted on-disk cache of access tokens per mobile.
+
+A restart reuses a token that is still valid instead of going through the OTP flow again.
+Tokens are encrypted with Fernet using a key kept in a separate file, both readable by the
+owner only. Needs `pip install cryptography`, without it nothing is cached.
+"""
+import os
+import json
+import base64
+import threading
+from datetime import datetime, timedelta
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+from .logger import log
+from .config import (
+    TOKEN_CACHE_FILE,
+    TOKEN_CACHE_KEY_FILE,
+    TOKEN_CACHE_MIN_VALIDITY,
+)
+
+
+def token_cache_available():
+    return Fernet is not None
+
+
+def jwt_expiry(token):
+    """
+    This function returns the `exp` claim of a JWT as datetime, None if the token has none
+    """
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return datetime.fromtimestamp(int(claims['exp']))
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenCache(object):
+    """
+    Access tokens with their expiry, by mobile; `base_url` keeps tokens of a stand-in or
+    another deployment apart from the real ones.
+    """
+
+    def __init__(self, path=TOKEN_CACHE_FILE, key_file=TOKEN_CACHE_KEY_FILE):
+        self.path = os.path.expanduser(path)
+        self.key_file = os.path.expanduser(key_file)
+        self._fernet = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _write_private(path, data):
+        tmp = f"{path}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    @property
+    def fernet(self):
+        if self._fernet is None:
+            if not os.path.exists(self.key_file):
+                self._write_private(self.key_file, Fernet.generate_key())
+            with open(self.key_file, 'rb') as f:
+                self._fernet = Fernet(f.read().strip())
+        return self._fernet
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(self.fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError) as e:
+            # new key or a damaged file, start over
+            log.warning(f"Ignoring unreadable token cache {self.path}: {e!r}")
+            return {}
+
+    def _write(self, entries):
+        self._write_private(self.path, self.fernet.encrypt(json.dumps(entries).encode('utf-8')))
+
+    def load(self, mobile, base_url, min_validity=TOKEN_CACHE_MIN_VALIDITY):
+        """
+        This function returns (token, expires) cached for `mobile`, None unless it stays valid
+        for at least `min_validity` seconds, by its recorded expiry and its own `exp` claim
+        """
+        with self._lock:
+            entry = self._read().get(str(mobile))
+        if not entry or entry.get('base_url') != base_url:
+            return None
+        expires = datetime.fromtimestamp(entry['expires'])
+        claimed = jwt_expiry(entry['token'])
+        if claimed:
+            expires = min(expires, claimed)
+        if expires - datetime.now() < timedelta(seconds=min_validity):
+            return None
+        return entry['token'], expires
+
+    def store(self, mobile, base_url, token, expires):
+        with self._lock:
+            now = datetime.now().timestamp()
+            entries = {key: entry for key, entry in self._read().items() if entry['expires'] > now}
+            entries[str(mobile)] = {'token': token, 'expires': expires.timestamp(), 'base_url': base_url}
+            self._write(entries)
+
+    def forget(self, mobile):
+        with self._lock:
+            entries = self._read()
+            if entries.pop(str(mobile), None) is not None:
+                self._write(entries)
@@ -0,0 +1,46 @@
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json
+from covid_vaccine_booking.booking_errors import (
+    classify_booking_response, BOOKED, CAPTCHA_WRONG, SLOT_FULL, SESSION_CLOSED, TOKEN_EXPIRED, RATE_LIMITED, UNKNOWN,
+)
+
+
+class Response(object):
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+# (status code, response body, expected outcome), bodies as returned by CoWIN
+BOOKING_RESPONSES = [
+    (200, {"appointment_confirmation_no": "1234567890"}, BOOKED),
+    (401, "Unauthenticated access!", TOKEN_EXPIRED),
+    (400, {"error": "Token expired"}, TOKEN_EXPIRED),
+    (403, {"errorCode": "USRAUT0001", "error": "Unauthenticated access!"}, TOKEN_EXPIRED),
+    (400, {"error": "Invalid Captcha"}, CAPTCHA_WRONG),
+    (400, {"errorCode": "APPOIN0040", "error": "This vaccination center is completely booked for the selected date. Please try another date or vaccination center."}, SLOT_FULL),
+    (400, {"error": "No capacity available for the selected session"}, SLOT_FULL),
+    (409, {"error": "Conflict"}, SLOT_FULL),
+    (400, {"error": "Session is not active"}, SESSION_CLOSED),
+    (400, {"error": "Selected session has expired"}, SESSION_CLOSED),
+    (400, {"error": "Appointment slot is not available"}, SESSION_CLOSED),
+    (429, "Too Many Requests", RATE_LIMITED),
+    (400, {"error": "Beneficiary capacity limit reached for this mobile"}, UNKNOWN),
+    (500, "<html>Internal Server Error</html>", UNKNOWN),
+]
+
+
+def test_classify_booking_response():
+    for status_code, body, expected in BOOKING_RESPONSES:
+        outcome = classify_booking_response(Response(status_code, body))
+        assert outcome == expected, f"{status_code} {body}: classified {outcome}, expected {expected}"
+    print(f"{len(BOOKING_RESPONSES)} booking responses classified as expected")
+
+
+if __name__ == "__main__":
+    test_classify_booking_response()
@@ -0,0 +1,322 @@
+"""
+Captcha preparation and solving benchmark.
+
+Synthesizes a labelled corpus of CoWIN style captchas from the glyphs of `captcha.svg`
+(random words, glyphs moved, jittered and recoloured, noise lines added), then runs every
+pipeline variant over it and records strip / render / palette / solve latency and solve
+accuracy. Each run is appended to `captcha_benchmark_history.json` and compared with the
+previous run on the same corpus, so a slower captcha prep shows up between releases.
+
+The synthetic corpus is drawn from the very glyphs of the packaged index, so its accuracy
+only shows the solver copes with placement, jitter and noise; it is recorded as
+`synthetic_accuracy` and never compared. Real accuracy needs a corpus of labelled captchas
+the index was not learned from (`--corpus`, optionally `--index` for a learned index).
+
+    cd tests
+    python captcha_benchmark.py --synthesize 200
+    python captcha_benchmark.py --corpus captcha_corpus --api-key APIKEY   # adds anti-captcha
+    python captcha_benchmark.py --corpus ~/real-captchas --index ~/cowin-captcha-glyphs.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from covid_vaccine_booking.glyph_solver import PATH_COMMAND, NUMBER, GlyphIndex, glyph_paths, glyph_from_path
+from covid_vaccine_booking.metrics import Histogram
+
+SOURCE_SVG = os.path.join(TESTS_DIR, 'captcha.svg')
+SOURCE_TEXT = 'SNNvu'
+CORPUS_DIR = os.path.join(TESTS_DIR, 'captcha_corpus')
+CORPUS_INFO = 'corpus.json'     # written next to a synthetic corpus
+PACKAGED_INDEX_FILE = os.path.join(os.path.dirname(TESTS_DIR), 'covid_vaccine_booking', 'captcha_glyphs.json')
+HISTORY_FILE = os.path.join(TESTS_DIR, 'captcha_benchmark_history.json')
+
+WIDTH, HEIGHT = 150, 50
+FILLS = ['#222', '#333', '#444', '#555', '#1f3a5f', '#5f1f3a', '#3a5f1f']
+REGRESSION_THRESHOLD = 0.25     # p50 more than 25% above the previous run
+
+
+def glyph_library(svg=None, text=SOURCE_TEXT):
+    """
+    This function returns {character: [path d, ..]} from the glyphs of a solved captcha
+    """
+    if svg is None:
+        with open(SOURCE_SVG) as f:
+            svg = f.read()
+    paths = sorted(glyph_paths(svg), key=lambda d: glyph_from_path(d).x)
+    library = {}
+    for char, d in zip(text, paths):
+        library.setdefault(char, []).append(d)
+    return library
+
+
+def transform_path(d, dx, dy, jitter, rng):
+    """
+    This function moves every point of an absolute path by (dx, dy) plus up to `jitter` noise
+    """
+    out = []
+    for command, args in PATH_COMMAND.findall(d):
+        numbers = [float(n) for n in NUMBER.findall(args)]
+        points = [
+            f"{x + dx + rng.uniform(-jitter, jitter):.2f} {y + dy + rng.uniform(-jitter, jitter):.2f}"
+            for x, y in zip(numbers[::2], numbers[1::2])
+        ]
+        out.append(command + " ".join(points))
+    return "".join(out)
+
+
+def noise_path(rng):
+    x0, x1 = rng.uniform(0, 20), rng.uniform(WIDTH - 20, WIDTH)
+    c = [f"{rng.uniform(20, WIDTH - 20):.0f} {rng.uniform(0, HEIGHT):.0f}" for _ in range(2)]
+    color = f"#{rng.randrange(0x444, 0xccc):03x}"
+    return (f'<path d="M{x0:.0f} {rng.uniform(0, HEIGHT):.0f} C{c[0]},{c[1]},{x1:.0f} {rng.uniform(0, HEIGHT):.0f}"'
+            f' stroke="{color}" fill="none"/>')
+
+
+def synthesize(rng, library, length=5, jitter=0.3, noise=2):
+    """
+    This function returns (label, svg) of a random word drawn with the library glyphs
+    """
+    label = "".join(rng.choice(sorted(library)) for _ in range(length))
+    elements = []
+    slot = (WIDTH - 20) / length
+    for i, char in enumerate(label):
+        d = rng.choice(library[char])
+        glyph = glyph_from_path(d)
+        dx = 10 + i * slot + rng.uniform(0, slot - 22) - glyph.x
+        dy = rng.uniform(-4, 4)
+        elements.append(f'<path fill="{rng.choice(FILLS)}" d="{transform_path(d, dx, dy, jitter, rng)}"/>')
+    for _ in range(noise):
+        elements.insert(rng.randrange(len(elements) + 1), noise_path(rng))
+    svg = (f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+           f'viewBox="0,0,{WIDTH},{HEIGHT}">{"".join(elements)}</svg>')
+    return label, svg
+
+
+def write_corpus(count, seed, corpus_dir=CORPUS_DIR, **kwargs):
+    rng = random.Random(seed)
+    library = glyph_library()
+    os.makedirs(corpus_dir, exist_ok=True)
+    for n in range(count):
+        label, svg = synthesize(rng, library, **kwargs)
+        with open(os.path.join(corpus_dir, f"{label}_{n}.svg"), 'w') as f:
+            f.write(svg)
+    with open(os.path.join(corpus_dir, CORPUS_INFO), 'w') as f:
+        json.dump({'synthetic': True, 'source': os.path.basename(SOURCE_SVG), 'count': count, 'seed': seed, **kwargs}, f)
+    print(f"Wrote {count} captchas to {corpus_dir}")
+
+
+def corpus_info(corpus_dir=CORPUS_DIR):
+    path = os.path.join(corpus_dir, CORPUS_INFO)
+    if not os.path.exists(path):
+        return {'synthetic': False}
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_corpus(corpus_dir=CORPUS_DIR):
+    corpus = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith('.svg'):
+            with open(os.path.join(corpus_dir, name)) as f:
+                corpus.append((name[:-len('.svg')].split('_')[0], f.read()))
+    return corpus
+
+
+def pipeline_variants(api_key=None, index_file=PACKAGED_INDEX_FILE):
+    """
+    This function returns {variant: [(stage, function)]}; a 'solve' stage returns the captcha text.
+    Variants whose packages are missing are left out.
+    """
+    from covid_vaccine_booking.captcha import strip_noise, render_captcha
+
+    index = GlyphIndex.load(index_file)
+    variants = {
+        'glyphs': [('solve', index.solve)],
+        'strip+glyphs': [('strip', strip_noise), ('solve', index.solve)],
+        'memory-png': [('strip', strip_noise), ('render', lambda svg: render_captcha(svg, fmt='PNG'))],
+    }
+
+    try:
+        from PIL import Image
+        from svglib.svglib import svg2rlg
+        from reportlab.graphics import renderPM
+    except ImportError:
+        print("Pillow not installed, skipping the palette (GIF) variants")
+    else:
+        def palette(png):
+            out = io.BytesIO()
+            Image.open(io.BytesIO(png)).convert('RGB').convert('P', palette=Image.ADAPTIVE).save(out, 'GIF')
+            return out.getvalue()
+
+        def render_file(svg):
+            # the original pipeline: svg and png through temporary files
+            with tempfile.TemporaryDirectory() as tmp:
+                svg_file, png_file = os.path.join(tmp, 'captcha.svg'), os.path.join(tmp, 'captcha.png')
+                with open(svg_file, 'w') as f:
+                    f.write(svg)
+                renderPM.drawToFile(svg2rlg(svg_file), png_file, fmt="PNG")
+                with open(png_file, 'rb') as f:
+                    return f.read()
+
+        variants['file-gif'] = [('strip', strip_noise), ('render', render_file), ('palette', palette)]
+        variants['memory-gif'] = variants['memory-png'] + [('palette', palette)]
+
+    if api_key:
+        from covid_vaccine_booking.captcha import captcha_builder_auto
+        # strips and renders in memory itself, so the solve stage covers the whole pipeline
+        variants['anticaptcha'] = [('solve', lambda svg: captcha_builder_auto({'captcha': svg}, api_key) or None)]
+    return variants
+
+
+def run_variant(stages, corpus, warmup=3, synthetic=False):
+    """
+    This function runs a variant over the corpus and returns its stage latencies and accuracy,
+    as `synthetic_accuracy` on a synthetic corpus
+    """
+    histograms = {stage: Histogram() for stage, _ in stages}
+    histograms['total'] = Histogram()
+    solves = any(stage == 'solve' for stage, _ in stages)
+    correct = unsolved = wrong = 0
+    for n, (label, svg) in enumerate(corpus[:warmup] + corpus):
+        value, started = svg, time.perf_counter()
+        timings = []
+        for stage, function in stages:
+            tic = time.perf_counter()
+            value = function(value)
+            timings.append((stage, time.perf_counter() - tic))
+        if n < warmup:
+            continue
+        for stage, seconds in timings:
+            histograms[stage].record(seconds)
+        histograms['total'].record(time.perf_counter() - started)
+        if solves:
+            if value is None:
+                unsolved += 1
+            elif value == label:
+                correct += 1
+            else:
+                wrong += 1
+    result = {
+        'stages': {
+            stage: {key: round(value * 1000, 3) if key != 'count' else value for key, value in histogram.summary().items()}
+            for stage, histogram in histograms.items()
+        },
+    }
+    if solves:
+        accuracy = 'synthetic_accuracy' if synthetic else 'accuracy'
+        result.update({accuracy: round(correct / len(corpus), 4), 'unsolved': unsolved, 'wrong': wrong})
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=TESTS_DIR, stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def regressions(previous, current, threshold=REGRESSION_THRESHOLD):
+    """
+    This function lists the stages whose p50 grew by more than `threshold`, and accuracy drops
+    on real captchas
+    """
+    found = []
+    for variant, result in current['variants'].items():
+        before = previous['variants'].get(variant)
+        if not before:
+            continue
+        for stage, summary in result['stages'].items():
+            old = before['stages'].get(stage, {}).get('p50')
+            if old and summary['p50'] > old * (1 + threshold):
+                found.append(f"{variant}/{stage}: p50 {old} ms -> {summary['p50']} ms")
+        if 'accuracy' in result and result['accuracy'] < before.get('accuracy', 0):
+            found.append(f"{variant}: accuracy {before['accuracy']} -> {result['accuracy']}")
+    return found
+
+
+def report(run):
+    synthetic = run['corpus'].get('synthetic')
+    if synthetic:
+        print("\nSynthetic corpus built from the packaged glyphs: accuracy is not a measure of real captchas")
+    print(f"\n{'variant':24} {'stage':8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}  "
+          + ("synthetic accuracy" if synthetic else "accuracy"))
+    for variant, result in run['variants'].items():
+        for stage, summary in result['stages'].items():
+            accuracy = result.get('synthetic_accuracy', result.get('accuracy', '')) if stage == 'total' else ''
+            print(f"{variant:24} {stage:8} {summary['p50']:9.3f} {summary['p95']:9.3f} {summary['max']:9.3f}  {accuracy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark captcha strip/render/palette/solve pipelines")
+    parser.add_argument('--corpus', default=CORPUS_DIR, help="directory of <label>_<n>.svg captchas")
+    parser.add_argument('--synthesize', type=int, metavar='N', help="(re)write N synthetic captchas to the corpus first")
+    parser.add_argument('--seed', type=int, default=1, help="seed of the synthetic corpus")
+    parser.add_argument('--jitter', type=float, default=0.3, help="point jitter of synthetic glyphs")
+    parser.add_argument('--index', default=PACKAGED_INDEX_FILE, help="glyph index of the glyph variants")
+    parser.add_argument('--variants', nargs='+', help="only run these variants")
+    parser.add_argument('--api-key', help="anti-captcha key, adds the (paid) remote solver variant")
+    parser.add_argument('--history', default=HISTORY_FILE, help="json file runs are appended to")
+    parser.add_argument('--no-save', action='store_true', help="do not append this run to the history")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        write_corpus(args.synthesize, args.seed, args.corpus, jitter=args.jitter)
+    corpus = read_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"No captchas in {args.corpus}, run with --synthesize N first")
+
+    info = corpus_info(args.corpus)
+    variants = pipeline_variants(args.api_key, args.index)
+    if args.variants:
+        variants = {name: stages for name, stages in variants.items() if name in args.variants}
+
+    run = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'path': os.path.relpath(args.corpus, TESTS_DIR), 'size': len(corpus), **info},
+        'index': os.path.relpath(args.index, TESTS_DIR),
+        'variants': {
+            name: run_variant(stages, corpus, synthetic=info['synthetic']) for name, stages in variants.items()
+        },
+    }
+    report(run)
+
+    history = load_history(args.history)
+    previous = next((r for r in reversed(history) if r['corpus'] == run['corpus']), None)
+    if previous:
+        found = regressions(previous, run)
+        print(f"\nCompared with {previous['revision']} ({previous['timestamp']}): "
+              + ("no regressions" if not found else f"{len(found)} regression(s)"))
+        for line in found:
+            print(f"  {line}")
+    if not args.no_save:
+        history.append(run)
+        with open(args.history, 'w') as f:
+            json.dump(history, f, indent=1)
+        print(f"\nRun saved to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
@@ -58,6 +58,22 @@ def test_captcha_builder_auto(api_key):
 
     return captcha_text
 
+def test_glyph_solver():
+    import os, sys, time
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from covid_vaccine_booking.glyph_solver import get_index
+    with open('captcha.svg') as f:
+        svg = f.read()
+
+    tic = time.perf_counter()
+    captcha_text = get_index().solve(svg)
+    toc = time.perf_counter()
+
+    if captcha_text == "SNNvu":
+        print(f"Local captcha solve success: {captcha_text} in {(toc - tic) * 1000:0.2f} ms")
+    else:
+        print(f"Local captcha solver returned {captcha_text} while expected: SNNvu")
+
 def test_python_packages():
     try:
         from PIL import Image
@@ -95,6 +111,7 @@ def test_tkinter_lib():
 
 
 test_python_packages()
+test_glyph_solver()
 test_tkinter_lib()
 test_captcha_builder()
 test_captcha_builder_auto("APIKEY") #http://anti-captcha.com
\ No newline at end of file